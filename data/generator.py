@@ -0,0 +1,92 @@
+import json, math, random, argparse
+
+# Synthetic instances in the schema of data.json. Attendances, sessions and room capacities follow
+# the shape of data.json (attendances in steps of 4, mostly small streams, rooms of a few standard
+# sizes); the sessions are then trimmed until they fill at most the load factor of the rooms x
+# slots, and the attendances lowered until the streams needing a room of each size fit in every
+# slot of the rooms of that size, so that the instance has a schedule.
+
+days = [("M", "monday"), ("T", "tuesday"), ("W", "wednesday"), ("R", "thursday"), ("F", "friday"), ("S", "saturday"), ("U", "sunday")]
+
+roomSizes = [(26, 3), (30, 14), (32, 2), (40, 21), (50, 1), (60, 8), (100, 4), (120, 2)]
+
+
+# =================================================
+#   Generator
+# =================================================
+
+def fit(streams, rooms, slots):
+    # Lower the attendance of the streams that do not fit in the rooms of their size class
+    sizes = sorted(set(r["max"] for r in rooms), reverse=True)
+    for k, c in enumerate(sizes):
+        capacity = slots * sum(1 for r in rooms if r["max"] >= c)
+        members = sorted([s for s in streams if s["att"] > (sizes[k + 1] if k + 1 < len(sizes) else 0)], key=lambda s: s["att"])
+        while sum(s["sessions"] for s in members) > capacity and k + 1 < len(sizes):
+            s = members.pop()
+            s["att"] = sizes[k + 1] - sizes[k + 1] % 4 if sizes[k + 1] >= 4 else sizes[k + 1]
+
+
+def generate(streams=130, rooms=57, buildings=6, areas=27, nDays=3, timeslots=5, density=0.03, load=0.65, seed=0):
+    rng = random.Random(seed)
+    slots = nDays * timeslots
+
+    data = {
+        "areas": [{"name": "Area_%d" % a, "id": a} for a in range(1, areas + 1)],
+        "areasMatrix": [],
+        "streams": [],
+        "buildings": [{"name": "Building %d" % b, "id": b} for b in range(1, buildings + 1)],
+        "rooms": [],
+        "days": [{"code": code, "name": name, "id": k + 1} for k, (code, name) in enumerate(days[:nDays])],
+        "timeslots": [chr(ord("A") + k) for k in range(timeslots)],
+    }
+    data["daysXtimeslots"] = [{"day": d["code"], "timeslot": t, "id": k * timeslots + n + 1} for k, d in enumerate(data["days"]) for n, t in enumerate(data["timeslots"])]
+
+    for a in range(1, areas + 1):
+        for a_ in range(a + 1, areas + 1):
+            if rng.random() < density:
+                data["areasMatrix"].append([a, a_])
+
+    sizes, weights = zip(*roomSizes)
+    for r in range(1, rooms + 1):
+        building = r if r <= buildings else rng.randint(1, buildings)
+        data["rooms"].append({"name": "r%03d" % r, "buildingId": building, "max": rng.choices(sizes, weights)[0], "id": r})
+    largest = max(r["max"] for r in data["rooms"])
+
+    for s in range(1, streams + 1):
+        att = min(largest - largest % 4, 4 * max(1, int(round(rng.lognormvariate(math.log(3.5), 0.7)))))
+        sessions = min(slots, max(1, int(rng.lognormvariate(math.log(3), 0.8))))
+        areaId = s if s <= areas else rng.randint(1, areas)
+        data["streams"].append({"name": "Stream %d" % s, "sessions": sessions, "areaId": areaId, "att": att, "id": s})
+
+    while sum(s["sessions"] for s in data["streams"]) > load * rooms * slots:
+        max(data["streams"], key=lambda s: s["sessions"])["sessions"] -= 1
+        if all(s["sessions"] == 1 for s in data["streams"]):
+            break
+    fit(data["streams"], data["rooms"], slots)
+
+    return data
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-o", "--o", help='output instance (JSON)', default="synthetic.json", type=str)
+    parser.add_argument("-st", "--st", help='streams', default=130, type=int)
+    parser.add_argument("-rm", "--rm", help='rooms', default=57, type=int)
+    parser.add_argument("-bd", "--bd", help='buildings', default=6, type=int)
+    parser.add_argument("-ar", "--ar", help='areas', default=27, type=int)
+    parser.add_argument("-dy", "--dy", help='days (at most 7)', default=3, type=int)
+    parser.add_argument("-ts", "--ts", help='timeslots per day', default=5, type=int)
+    parser.add_argument("-dn", "--dn", help='density of related area pairs (areasMatrix)', default=0.03, type=float)
+    parser.add_argument("-ld", "--ld", help='sessions / (rooms x slots) at most', default=0.65, type=float)
+    parser.add_argument("-sd", "--sd", help='random seed', default=0, type=int)
+    args = parser.parse_args()
+
+    data = generate(streams=args.st, rooms=args.rm, buildings=args.bd, areas=args.ar, nDays=args.dy, timeslots=args.ts, density=args.dn, load=args.ld, seed=args.sd)
+
+    with open(args.o, "w") as outfile:
+        json.dump(data, outfile)
+
+    print("%s: %d streams (%d sessions), %d rooms in %d buildings, %d areas (%d related pairs), %d slots" % (args.o, len(data["streams"]), sum(s["sessions"] for s in data["streams"]),
+                                                                                                            len(data["rooms"]), len(data["buildings"]), len(data["areas"]), len(data["areasMatrix"]), len(data["daysXtimeslots"])))
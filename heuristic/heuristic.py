@@ -1,33 +1,39 @@
-import os, json, pathlib
+import os, sys, json, pathlib
 
-try:
-    path = os.getcwd()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyomo"))
+import instance
 
-    f = open("%s\\..\\data\\light.json" % pathlib.Path().resolve(), "r")
-    data = json.loads(f.read())
-    f.close()
 
-    def permutation(prmnt, max):
-        return 0 if prmnt + 1 >= max else (prmnt + 1)
+def permutation(prmnt, max):
+    return 0 if prmnt + 1 >= max else (prmnt + 1)
 
+
+# =================================================
+#   Greedy packing
+# =================================================
+
+def greedy(data):
+    # Streams (largest attendance first) are packed into the free slots of the buildings, rooms
+    # ordered by decreasing capacity, moving round-robin to the next building after each stream.
     out = []
-    data["streams"].sort(key=lambda x: (x.get('att'), x.get('sessions')), reverse=True)
-    streams = data["streams"]
-    data["rooms"].sort(key=lambda x: x.get('max'), reverse=True)
-    rooms = data["rooms"]
+    streams = sorted(data["streams"], key=lambda x: (x.get('att'), x.get('sessions')), reverse=True)
+    rooms = sorted(data["rooms"], key=lambda x: x.get('max'), reverse=True)
     dxt = data["daysXtimeslots"]
     buildings = data["buildings"]
+    position = {building["id"]: k for k, building in enumerate(buildings)}
 
     slotsUsed = []
-    for building in data["buildings"]:
+    for building in buildings:
         out.append({"id": building["id"], "slots": []})
         slotsUsed.append(0)
 
     for room in rooms:
         for ts in dxt:
-            out[(room["buildingId"] - 1)]["slots"].append({
+            out[position[room["buildingId"]]]["slots"].append({
                 "roomId": room["id"],
                 "time": "%s%s" % (ts["day"], ts["timeslot"]),
+                "day": ts["day"],
+                "timeslot": ts["timeslot"],
                 "stream": None,
                 "sessionNo": None,
                 "max": room["max"],
@@ -35,7 +41,7 @@ try:
                 "areaId": None
             })
 
-    prmnt = 1
+    prmnt = 1 if len(buildings) > 1 else 0
     for stream in streams:
         maxTry = len(buildings)
         while 0 < maxTry:
@@ -64,39 +70,85 @@ try:
             slotsUsed[prmnt] += 1
         prmnt = permutation(prmnt, len(buildings))
 
-    print("La solution est réalisable")
+    return out
 
-    areasMatrix = []
-    for area in data["areasMatrix"]:
-        areasMatrix.append({"a": area[0], "a_": area[1], "ok": False})
-        areasMatrix.append({"a": area[1], "a_": area[0], "ok": False})
 
+def checkColocation(data, out):
+    # Related areas (areasMatrix) that do not share any building
+    areasBuildings = {}
     for building in out:
         for slot in building["slots"]:
-            for slots_ in building["slots"]:
-                for aXa in areasMatrix:
-                    if aXa["a"] == slot["areaId"] and aXa["a_"] == slots_["areaId"]:
-                        aXa["ok"] = True
+            if slot["areaId"] is not None:
+                areasBuildings.setdefault(slot["areaId"], set()).add(building["id"])
 
-    for aXa in areasMatrix:
-        if not aXa["ok"]:
-            print("La colocalisation des areas %d et %d n'as pas été validée" % (aXa["a"], aXa["a_"]))
+    missing = []
+    for a, a_ in data["areasMatrix"]:
+        if len(areasBuildings.get(a, set()) & areasBuildings.get(a_, set())) == 0:
+            missing.append((a, a_))
+    return missing
 
-    result = {}
-    for building in buildings:
-        result[building["id"]] = {"buildingId": building["id"],"X": []}
 
+# =================================================
+#   Stage solution
+# =================================================
+
+def assignment(data, out=None):
+    # Greedy schedule in the format of a stage result (the nonzero X/Y/Q records), usable as a
+    # warm start for mip1 or as a fallback schedule
+    out = greedy(data) if out is None else out
+    streams = instance.indexes(data)["streams"]
+
+    x = []
+    y = {}
+    q = {}
     for building in out:
         for slot in building["slots"]:
             if slot["stream"] is None: continue
-            result[building['id']]["X"].append({"tuple": (int(slot["areaId"]), int(slot["stream"]), int(building['id']), int(slot["roomId"]), slot["time"][:1], slot["time"][1:]), "state": 1.0})
+            areaId = int(streams[slot["stream"]]["areaId"])
+            x.append({"tuple": (areaId, int(slot["stream"]), int(building["id"]), int(slot["roomId"]), slot["day"], slot["timeslot"]), "state": 1})
+            y[(areaId, int(slot["stream"]), int(building["id"]))] = 1
+            q[(areaId, int(building["id"]))] = 1
 
-    for building in buildings:
-        with open('output/result_%s.json' % (int(building['id'])), 'w') as outfile:
-            json.dump(result[int(building['id'])], outfile)
-        os.system("python \"%s\\..\\pyomo\\visualizer.py\" "
-                  "-rd \"%s\\..\\data\\light.json\" "
-                  "-d \"%s\\output\\result_%d.json\"" %(pathlib.Path().resolve(),pathlib.Path().resolve(),pathlib.Path().resolve(), int(building['id'])))
-
-except Exception as e:
-    print(e)
+    buildingsPerArea = {}
+    for a, b in q:
+        buildingsPerArea[a] = buildingsPerArea.get(a, 0) + 1
+
+    return {"objective": {"value": sum(n - 1 for n in buildingsPerArea.values())},
+            "X": x,
+            "Y": [{"tuple": i, "state": 1} for i in y],
+            "Q": [{"tuple": i, "state": 1} for i in q]}
+
+
+if __name__ == '__main__':
+
+    try:
+        path = os.getcwd()
+
+        data = instance.load("%s\\..\\data\\light.json" % pathlib.Path().resolve())
+
+        out = greedy(data)
+        buildings = data["buildings"]
+
+        print("La solution est réalisable")
+
+        for a, a_ in checkColocation(data, out):
+            print("La colocalisation des areas %d et %d n'as pas été validée" % (a, a_))
+
+        result = {}
+        for building in buildings:
+            result[building["id"]] = {"buildingId": building["id"],"X": []}
+
+        for building in out:
+            for slot in building["slots"]:
+                if slot["stream"] is None: continue
+                result[building['id']]["X"].append({"tuple": (int(slot["areaId"]), int(slot["stream"]), int(building['id']), int(slot["roomId"]), slot["time"][:1], slot["time"][1:]), "state": 1.0})
+
+        for building in buildings:
+            with open('output/result_%s.json' % (int(building['id'])), 'w') as outfile:
+                json.dump(result[int(building['id'])], outfile)
+            os.system("python \"%s\\..\\pyomo\\visualizer.py\" "
+                      "-rd \"%s\\..\\data\\light.json\" "
+                      "-d \"%s\\output\\result_%d.json\"" %(pathlib.Path().resolve(),pathlib.Path().resolve(),pathlib.Path().resolve(), int(building['id'])))
+
+    except Exception as e:
+        print(e)
@@ -0,0 +1,388 @@
+import json, math, random, pathlib, argparse
+import heuristic, instance
+
+# Tabu search on top of the greedy schedule. The schedule is kept in flat arrays indexed by
+# positions (stream i, room j, slot t, session k, area a, building b):
+#   - grid[j*T + t]      session held by room j at slot t (-1 when free)
+#   - busy[i*T + t]      session of stream i at slot t (-1 when none)
+#   - areaCount[a*B + b] streams of area a in building b
+# together with the room/slot of every session and the building of every stream. A move is a list
+# of (session, room, slot) changes; its feasibility is checked against the arrays and its effect
+# on the five objectives (mip1 to mip5) is computed from the counters of the moved streams only,
+# without touching the rest of the schedule.
+
+stages = 5
+
+
+# =================================================
+#   State
+# =================================================
+
+def buildState(data, out):
+    dxt = sorted(data["daysXtimeslots"], key=lambda x: x["id"])
+    state = {
+        "data": data,
+        "streams": [s["id"] for s in data["streams"]],
+        "rooms": [r["id"] for r in data["rooms"]],
+        "buildings": [b["id"] for b in data["buildings"]],
+        "areas": [a["id"] for a in data["areas"]],
+        "dxt": [(x["day"], x["timeslot"]) for x in dxt],
+        "val": [x["id"] for x in dxt],
+    }
+    S = len(state["streams"])
+    R = len(state["rooms"])
+    T = len(state["dxt"])
+    B = len(state["buildings"])
+    A = len(state["areas"])
+    state.update({"S": S, "R": R, "T": T, "B": B, "A": A})
+
+    streamPos = {v: i for i, v in enumerate(state["streams"])}
+    roomPos = {v: j for j, v in enumerate(state["rooms"])}
+    buildingPos = {v: b for b, v in enumerate(state["buildings"])}
+    areaPos = {v: a for a, v in enumerate(state["areas"])}
+    slotPos = {v: t for t, v in enumerate(state["dxt"])}
+
+    state["area"] = [areaPos[s["areaId"]] for s in data["streams"]]
+    state["sessions"] = [s["sessions"] for s in data["streams"]]
+    state["roomBuilding"] = [buildingPos[r["buildingId"]] for r in data["rooms"]]
+    state["buildingRooms"] = [[] for b in range(B)]
+    for j, b in enumerate(state["roomBuilding"]):
+        state["buildingRooms"][b].append(j)
+
+    # Room utility of mip5, None when the room is too small for the stream
+    state["util"] = [None] * (S * R)
+    for i, s in enumerate(data["streams"]):
+        for j, r in enumerate(data["rooms"]):
+            if int(r["max"]) >= int(s["att"]):
+                state["util"][i * R + j] = round(math.log(int(r["max"]) / int(s["att"])), 6)
+
+    state["related"] = [[] for a in range(A)]
+    for a, a_ in data["areasMatrix"]:
+        if areaPos[a_] not in state["related"][areaPos[a]]:
+            state["related"][areaPos[a]].append(areaPos[a_])
+        if areaPos[a] not in state["related"][areaPos[a_]]:
+            state["related"][areaPos[a_]].append(areaPos[a])
+
+    state["sessStream"] = []
+    state["sessRoom"] = []
+    state["sessSlot"] = []
+    for building in out:
+        for slot in building["slots"]:
+            if slot["stream"] is None: continue
+            state["sessStream"].append(streamPos[slot["stream"]])
+            state["sessRoom"].append(roomPos[slot["roomId"]])
+            state["sessSlot"].append(slotPos[(slot["day"], slot["timeslot"])])
+
+    return rebuild(state)
+
+
+def rebuild(state):
+    S, R, T, B, A = state["S"], state["R"], state["T"], state["B"], state["A"]
+
+    state["streamSessions"] = [[] for i in range(S)]
+    state["grid"] = [-1] * (R * T)
+    state["busy"] = [-1] * (S * T)
+    state["roomUse"] = [0] * (S * R)
+    state["areaCount"] = [0] * (A * B)
+    state["building"] = [-1] * S
+
+    for k, i in enumerate(state["sessStream"]):
+        j = state["sessRoom"][k]
+        t = state["sessSlot"][k]
+        state["streamSessions"][i].append(k)
+        state["grid"][j * T + t] = k
+        state["busy"][i * T + t] = k
+        state["roomUse"][i * R + j] += 1
+        state["building"][i] = state["roomBuilding"][j]
+
+    for i in range(S):
+        state["areaCount"][state["area"][i] * B + state["building"][i]] += 1
+
+    state["objectives"] = objectives(state)
+    return state
+
+
+# =================================================
+#   Objectives
+# =================================================
+
+def streamTerms(state, i, places):
+    # Rooms (mip3), gaps (mip4) and utility (mip5) terms of stream i for the (room, slot) places
+    # of its sessions
+    R = state["R"]
+    val = state["val"]
+    rooms = len(set(j for j, t in places)) - 1
+    gaps = max(val[t] for j, t in places) - min(val[t] for j, t in places) - state["sessions"][i] + 1
+    utility = sum(state["util"][i * R + j] for j, t in places)
+    return rooms, gaps, utility
+
+
+def present(state, a, b):
+    return 1 if state["areaCount"][a * state["B"] + b] > 0 else 0
+
+
+def objectives(state):
+    B = state["B"]
+    f = [0, 0, 0, 0, 0.0]
+    for a in range(state["A"]):
+        f[0] += sum(present(state, a, b) for b in range(B)) - 1
+        for a_ in state["related"][a]:
+            f[1] += sum(present(state, a, b) * present(state, a_, b) for b in range(B))
+    for i in range(state["S"]):
+        places = [(state["sessRoom"][k], state["sessSlot"][k]) for k in state["streamSessions"][i]]
+        rooms, gaps, utility = streamTerms(state, i, places)
+        f[2] += rooms
+        f[3] += gaps
+        f[4] += utility
+    return f
+
+
+def cost(f):
+    # Lexicographic cost: mip1 and mip3/4 minimize, mip2 and mip5 maximize
+    return (f[0], -f[1], f[2], f[3], -round(f[4], 6))
+
+
+def presenceDelta(state, a, b, change):
+    # Change of the building count (mip1) and of the co-allocated pairs (mip2) when area a
+    # enters (+1) or leaves (-1) building b
+    pairs = sum(2 * present(state, a_, b) for a_ in state["related"][a] if a_ != a)
+    if a in state["related"][a]:
+        pairs += 1
+    return change, change * pairs
+
+
+# =================================================
+#   Moves
+# =================================================
+
+def evaluate(state, changes):
+    # Objective deltas of the changes [(session, room, slot)], None when they are not feasible
+    R, T, B = state["R"], state["T"], state["B"]
+    grid = state["grid"]
+    busy = state["busy"]
+
+    moved = {k: (j, t) for k, j, t in changes}
+    cells = set()
+    for k, (j, t) in moved.items():
+        i = state["sessStream"][k]
+        if state["util"][i * R + j] is None or (j, t) in cells:
+            return None
+        cells.add((j, t))
+        if grid[j * T + t] != -1 and grid[j * T + t] not in moved:
+            return None
+        if busy[i * T + t] != -1 and busy[i * T + t] not in moved:
+            return None
+
+    streams = set(state["sessStream"][k] for k in moved)
+    delta = [0, 0, 0, 0, 0.0]
+    for i in streams:
+        old = [(state["sessRoom"][k], state["sessSlot"][k]) for k in state["streamSessions"][i]]
+        new = [moved.get(k, place) for k, place in zip(state["streamSessions"][i], old)]
+        if len(set(t for j, t in new)) != len(new) or len(set(state["roomBuilding"][j] for j, t in new)) != 1:
+            return None
+
+        before = streamTerms(state, i, old)
+        after = streamTerms(state, i, new)
+        for n in range(3):
+            delta[2 + n] += after[n] - before[n]
+
+        b = state["building"][i]
+        b_ = state["roomBuilding"][new[0][0]]
+        if b != b_:
+            a = state["area"][i]
+            if state["areaCount"][a * B + b] == 1:
+                count, pairs = presenceDelta(state, a, b, -1)
+                delta[0] += count
+                delta[1] += pairs
+            if state["areaCount"][a * B + b_] == 0:
+                count, pairs = presenceDelta(state, a, b_, 1)
+                delta[0] += count
+                delta[1] += pairs
+
+    return delta
+
+
+def apply(state, changes, delta):
+    R, T, B = state["R"], state["T"], state["B"]
+
+    for k, j, t in changes:
+        i = state["sessStream"][k]
+        if state["grid"][state["sessRoom"][k] * T + state["sessSlot"][k]] == k:
+            state["grid"][state["sessRoom"][k] * T + state["sessSlot"][k]] = -1
+        if state["busy"][i * T + state["sessSlot"][k]] == k:
+            state["busy"][i * T + state["sessSlot"][k]] = -1
+        state["roomUse"][i * R + state["sessRoom"][k]] -= 1
+    for k, j, t in changes:
+        i = state["sessStream"][k]
+        state["grid"][j * T + t] = k
+        state["busy"][i * T + t] = k
+        state["roomUse"][i * R + j] += 1
+        state["sessRoom"][k] = j
+        state["sessSlot"][k] = t
+
+    for i in set(state["sessStream"][k] for k, j, t in changes):
+        b_ = state["roomBuilding"][state["sessRoom"][state["streamSessions"][i][0]]]
+        if b_ != state["building"][i]:
+            state["areaCount"][state["area"][i] * B + state["building"][i]] -= 1
+            state["areaCount"][state["area"][i] * B + b_] += 1
+            state["building"][i] = b_
+
+    for n in range(stages):
+        state["objectives"][n] += delta[n]
+
+
+def moveStream(state, rng):
+    # Every session of a stream to another building, at the same slots, in the room of the
+    # stream there when it is free, else in the free room with the best utility
+    R, T = state["R"], state["T"]
+    i = rng.randrange(state["S"])
+    b = rng.randrange(state["B"])
+    if b == state["building"][i]:
+        return None
+
+    changes = []
+    chosen = None
+    for k in state["streamSessions"][i]:
+        t = state["sessSlot"][k]
+        free = [j for j in state["buildingRooms"][b] if state["grid"][j * T + t] == -1 and state["util"][i * R + j] is not None]
+        if len(free) == 0:
+            return None
+        j = chosen if chosen in free else max(free, key=lambda j: state["util"][i * R + j])
+        chosen = j
+        changes.append((k, j, t))
+    return changes
+
+
+def swapRoom(state, rng):
+    # A session to another room of its building at the same slot, swapped with the session
+    # already there if any
+    T = state["T"]
+    k = rng.randrange(len(state["sessStream"]))
+    j = state["sessRoom"][k]
+    t = state["sessSlot"][k]
+    j_ = rng.choice(state["buildingRooms"][state["roomBuilding"][j]])
+    if j_ == j:
+        return None
+    k_ = state["grid"][j_ * T + t]
+    return [(k, j_, t)] if k_ == -1 else [(k, j_, t), (k_, j, t)]
+
+
+def shiftSlot(state, rng):
+    # A session to another slot of its room, swapped with the session already there if any
+    T = state["T"]
+    k = rng.randrange(len(state["sessStream"]))
+    j = state["sessRoom"][k]
+    t = state["sessSlot"][k]
+    t_ = rng.randrange(T)
+    if t_ == t:
+        return None
+    k_ = state["grid"][j * T + t_]
+    return [(k, j, t_)] if k_ == -1 else [(k, j, t_), (k_, j, t)]
+
+
+moves = [(moveStream, 0.2), (swapRoom, 0.4), (shiftSlot, 0.4)]
+
+
+# =================================================
+#   Tabu search
+# =================================================
+
+def search(data, out=None, iterations=10000, neighbours=20, tenure=10, seed=0):
+    # At each iteration the best of a sample of feasible moves is applied, even when it worsens
+    # the schedule, unless it moves a stream changed during the last `tenure` iterations (tabu)
+    # and does not improve on the best schedule found.
+    rng = random.Random(seed)
+    state = buildState(data, heuristic.greedy(data) if out is None else out)
+
+    best = cost(state["objectives"])
+    bestPlaces = (list(state["sessRoom"]), list(state["sessSlot"]))
+    tabu = {}
+
+    for it in range(iterations):
+        candidate = None
+        for n in range(neighbours):
+            move = rng.choices([m for m, w in moves], weights=[w for m, w in moves])[0]
+            changes = move(state, rng)
+            if changes is None:
+                continue
+            delta = evaluate(state, changes)
+            if delta is None:
+                continue
+            value = cost([state["objectives"][n] + delta[n] for n in range(stages)])
+            streams = set(state["sessStream"][k] for k, j, t in changes)
+            if any(tabu.get(i, -1) >= it for i in streams) and value >= best:
+                continue
+            if candidate is None or value < candidate[0]:
+                candidate = (value, changes, delta, streams)
+
+        if candidate is None:
+            continue
+
+        value, changes, delta, streams = candidate
+        apply(state, changes, delta)
+        for i in streams:
+            tabu[i] = it + tenure
+
+        if value < best:
+            best = value
+            bestPlaces = (list(state["sessRoom"]), list(state["sessSlot"]))
+
+    state["sessRoom"], state["sessSlot"] = bestPlaces
+    return rebuild(state)
+
+
+# =================================================
+#   Stage solution
+# =================================================
+
+def assignment(state):
+    # Schedule in the format of a stage result (nonzero records of X/Y/Q/U and FIRST/LAST),
+    # usable as a warm start of any stage
+    streams, rooms, buildings, areas = state["streams"], state["rooms"], state["buildings"], state["areas"]
+    x = []
+    u = {}
+    slots = {}
+    for k, i in enumerate(state["sessStream"]):
+        j = state["sessRoom"][k]
+        t = state["sessSlot"][k]
+        a = areas[state["area"][i]]
+        b = buildings[state["roomBuilding"][j]]
+        x.append({"tuple": (a, streams[i], b, rooms[j], state["dxt"][t][0], state["dxt"][t][1]), "state": 1})
+        u[(a, streams[i], b, rooms[j])] = 1
+        slots.setdefault((a, streams[i]), []).append(state["val"][t])
+
+    y = [(areas[state["area"][i]], streams[i], buildings[state["building"][i]]) for i in range(state["S"])]
+    q = sorted(set((a, b) for a, s, b in y))
+
+    f = state["objectives"]
+    return {"objective": {"value": f[0]},
+            "objectives": {"mip%d" % (n + 1): f[n] for n in range(stages)},
+            "X": x,
+            "Y": [{"tuple": i, "state": 1} for i in y],
+            "Q": [{"tuple": i, "state": 1} for i in q],
+            "U": [{"tuple": i, "state": 1} for i in u],
+            "FIRST": [{"tuple": i, "state": min(slots[i])} for i in slots],
+            "LAST": [{"tuple": i, "state": max(slots[i])} for i in slots]}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-rd", "--rd", help='raw data', default="%s/../data/light.json" % pathlib.Path().resolve(), type=str)
+    parser.add_argument("-it", "--it", help='iterations', default=10000, type=int)
+    parser.add_argument("-nb", "--nb", help='moves sampled per iteration', default=20, type=int)
+    parser.add_argument("-tt", "--tt", help='tabu tenure (iterations)', default=10, type=int)
+    parser.add_argument("-sd", "--sd", help='random seed', default=0, type=int)
+    parser.add_argument("-o", "--o", help='write the schedule as a stage result (JSON)', default=None, type=str)
+    args = parser.parse_args()
+
+    data = instance.load(args.rd)
+
+    print("greedy      %s" % objectives(buildState(data, heuristic.greedy(data))))
+    state = search(data, iterations=args.it, neighbours=args.nb, tenure=args.tt, seed=args.sd)
+    print("tabu search %s" % state["objectives"])
+
+    if args.o is not None:
+        with open(args.o, "w") as outfile:
+            json.dump(assignment(state), outfile)
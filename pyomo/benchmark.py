@@ -0,0 +1,330 @@
+import os, sys, time, pathlib, logging, argparse, resource, multiprocessing, builder, instance, solver, pipeline, warmstart
+from concurrent.futures import ProcessPoolExecutor
+import pyomo.environ as pyo
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "heuristic"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+import heuristic, localsearch, generator
+
+logging.getLogger().setLevel(logging.INFO)
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("-rd", "--rd", help='raw data', default="%s/../data/data.json" % pathlib.Path(__file__).parent.resolve(), type=str)
+parser.add_argument("-m", "--m", help='benchmark (build: model construction, formulation: default vs tight formulation, gaps: big-M vs time-indexed FIRST/LAST, symmetry: with and without room symmetry breaking, scaling: every stage and the heuristics on generated instances of growing size)', default="build", type=str)
+parser.add_argument("-n", "--n", help='repetitions', default=3, type=int)
+parser.add_argument("-sv", "--sv", help='solver backend of the solve benchmarks', default="cplex", type=str)
+parser.add_argument("-mt", "--mt", help='maximum thread', default=4, type=int)
+parser.add_argument("-tl", "--tl", help='time limit (s) of each solve', default=300, type=int)
+parser.add_argument("-sz", "--sz", help='scaling: streams of each generated instance, separated by commas (rooms, buildings and areas in the proportions of data.json)', default="25,50,100", type=str)
+parser.add_argument("-sg", "--sg", help='scaling: stages to run, separated by commas', default="1,2,3,4,5", type=str)
+parser.add_argument("-it", "--it", help='scaling: local search iterations (heuristic row and upstream of stages 3 to 5)', default=2000, type=int)
+args = parser.parse_args()
+
+
+# =================================================
+#   Upstream results
+# =================================================
+
+def fakeUpstream(data):
+    # Streams are spread round-robin over the buildings that have a room large enough for them,
+    # so that every per-building model is feasible to construct.
+    largest = {}
+    for room in data["rooms"]:
+        largest[room["buildingId"]] = max(largest.get(room["buildingId"], 0), int(room["max"]))
+    buildings = [i["id"] for i in data["buildings"]]
+    out = {b: {"buildingId": b, "objective": {"value": 0}, "areas": [], "streams": []} for b in buildings}
+    for k, stream in enumerate(data["streams"]):
+        fits = [b for b in buildings if largest.get(b, 0) >= int(stream["att"])]
+        b = fits[k % len(fits)]
+        out[b]["streams"].append(stream["id"])
+        if stream["areaId"] not in out[b]["areas"]:
+            out[b]["areas"].append(stream["areaId"])
+    mip1 = {"objective": {"value": 0},
+            "Q": [{"tuple": (a, b), "state": 1 if a in out[b]["areas"] else 0} for a in [i["id"] for i in data["areas"]] for b in buildings]}
+    return mip1, [out[b] for b in buildings if len(out[b]["streams"]) > 0]
+
+
+def searchUpstream(data, iterations=2000):
+    # Per-building mip3 results taken from the local search schedule: a feasible start for mip4
+    # with the rooms objective of that schedule as bound
+    schedule = localsearch.assignment(localsearch.search(data, iterations=iterations))
+    masters = {}
+    for i in schedule["Y"]:
+        a, s, b = i["tuple"]
+        master = masters.setdefault(b, {"buildingId": b, "objective": {"value": 0}, "areas": [], "streams": []})
+        master["streams"].append(s)
+        if a not in master["areas"]:
+            master["areas"].append(a)
+    for b in masters:
+        for name in ["X", "Y", "Q", "U"]:
+            masters[b][name] = [i for i in schedule[name] if i["tuple"][-1 if name == "Q" else 2] == b]
+        rooms = {}
+        for i in masters[b]["U"]:
+            rooms[i["tuple"][1]] = rooms.get(i["tuple"][1], 0) + 1
+        masters[b]["objective"]["value"] = sum(n - 1 for n in rooms.values())
+    return [masters[b] for b in sorted(masters)]
+
+
+def countModel(model):
+    variables = sum(1 for _ in model.component_data_objects(pyo.Var))
+    constraints = sum(1 for _ in model.component_data_objects(pyo.Constraint, active=True))
+    return variables, constraints
+
+
+# =================================================
+#   Solve
+# =================================================
+
+def solveTimed(model, stage, relax=False, warm=False):
+    # Objective, best bound, nodes (when the backend reports them) and solve time
+    if relax:
+        model = model.clone()
+        pyo.TransformationFactory("core.relax_integer_vars").apply_to(model)
+    backend = solver.stageBackend(args.sv, stage)
+    opt = solver.getSolver(backend, args.mt, timelimit=None if relax else args.tl, mipgap=None if relax else solver.limits[stage][1])
+    start = time.perf_counter()
+    results, timing = solver.solve(backend, opt, model, "benchmark.log", warmstart=warm)
+    elapsed = time.perf_counter() - start
+
+    bound = solver.bestBound(results, model.objective.sense)
+    nodes = None
+    try:
+        nodes = results.solver.statistics.branch_and_bound.number_of_created_subproblems
+    except AttributeError:
+        pass
+    return {"objective": pyo.value(model.objective, exception=False), "bound": bound,
+            "nodes": nodes if isinstance(nodes, int) else None, "time": elapsed}
+
+
+def printSolve(name, stage, building, lp, mip):
+    print("%-10s %-6d %-10s %12s %12s %12s %8s %10.3f" % (name, stage, building, "%.3f" % lp["objective"],
+                                                        "-" if mip["objective"] is None else "%.3f" % mip["objective"],
+                                                        "-" if not isinstance(mip["bound"], (int, float)) else "%.3f" % mip["bound"],
+                                                        "-" if mip["nodes"] is None else mip["nodes"], mip["time"]))
+
+
+# =================================================
+#   Benchmarks
+# =================================================
+
+def timeBuild(data, stage, warmup=None, mip3=None):
+    best = None
+    for _ in range(args.n):
+        start = time.perf_counter()
+        model = builder.buildModel(data, stage, warmup=warmup, mip3=mip3)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, countModel(model)
+
+
+def benchBuild(data):
+    start = time.perf_counter()
+    builder.coreIndex(data)
+    logging.info("[%s] core index built in %.3fs" % (datetime.now(), time.perf_counter() - start))
+
+    mip1, masters = fakeUpstream(data)
+
+    print("%-6s %-10s %10s %10s %12s" % ("stage", "building", "time (s)", "variables", "constraints"))
+
+    for stage in [1, 2]:
+        elapsed, (variables, constraints) = timeBuild(data, stage, warmup=mip1 if stage == 2 else None)
+        print("%-6d %-10s %10.3f %10d %12d" % (stage, "all", elapsed, variables, constraints))
+
+    for stage in [3, 4, 5]:
+        for warmup in masters:
+            elapsed, (variables, constraints) = timeBuild(builder.warmupData(data, warmup), stage, warmup=warmup, mip3=warmup)
+            print("%-6d %-10d %10.3f %10d %12d" % (stage, warmup["buildingId"], elapsed, variables, constraints))
+
+
+def benchFormulation(data):
+    # Stages 1 and 2 (the only ones with Q and V) with each formulation: size, LP relaxation bound,
+    # then the MIP under the stage gap and the time limit. Stage 1 is warm-started from the greedy
+    # heuristic, stage 2 from the stage 1 result of the same formulation.
+    print("%-10s %-6s %10s %12s" % ("", "stage", "variables", "constraints"))
+    for formulation in ["default", "tight"]:
+        for stage, warmup in [(1, None), (2, fakeUpstream(data)[0])]:
+            variables, constraints = countModel(builder.buildModel(data, stage, warmup=warmup, options={"formulation": formulation}))
+            print("%-10s %-6d %10d %12d" % (formulation, stage, variables, constraints))
+
+    print("%-10s %-6s %-10s %12s %12s %12s %8s %10s" % ("", "stage", "building", "LP bound", "objective", "bound", "nodes", "time (s)"))
+    for formulation in ["default", "tight"]:
+        options = {"formulation": formulation}
+
+        model = builder.buildModel(data, 1, options=options)
+        lp = solveTimed(model, 1, relax=True)
+        warmstart.apply(model, heuristic.assignment(data))
+        mip = solveTimed(model, 1, warm=True)
+        printSolve(formulation, 1, "all", lp, mip)
+        if mip["objective"] is None:
+            continue
+
+        mip1 = pipeline.exportGlobal(model)
+        model = builder.buildModel(data, 2, warmup=mip1, options=options)
+        lp = solveTimed(model, 2, relax=True)
+        warmstart.apply(model, mip1)
+        mip = solveTimed(model, 2, warm=True)
+        printSolve(formulation, 2, "all", lp, mip)
+
+
+def benchGaps(data):
+    # mip4 of every building with each FIRST/LAST formulation, warm-started from the local search
+    # schedule: time to reach the stage gap (or the time limit) and the gap left
+    masters = searchUpstream(data)
+    print("%-10s %-6s %-10s %10s %12s %12s %12s %8s %10s %8s" % ("", "stage", "building", "variables", "LP bound", "objective", "bound", "nodes", "time (s)", "gap"))
+    for gaps in ["bigm", "time"]:
+        for warmup in masters:
+            model = builder.buildModel(builder.warmupData(data, warmup), 4, warmup=warmup, options={"gaps": gaps})
+            variables, constraints = countModel(model)
+            lp = solveTimed(model, 4, relax=True)
+            warmstart.apply(model, warmup)
+            mip = solveTimed(model, 4, warm=True)
+            gap = solver.relativeGap(mip["objective"], mip["bound"])
+            print("%-10s %-6d %-10d %10d %12.3f %12s %12s %8s %10.3f %8s" % (gaps, 4, warmup["buildingId"], variables, lp["objective"],
+                                                                            "-" if mip["objective"] is None else "%.3f" % mip["objective"],
+                                                                            "-" if not isinstance(mip["bound"], (int, float)) else "%.3f" % mip["bound"],
+                                                                            "-" if mip["nodes"] is None else mip["nodes"], mip["time"],
+                                                                            "-" if gap is None else "%.1f%%" % (100 * gap)))
+
+
+def benchSymmetry(data):
+    # Stage 1 (warm-started from the greedy heuristic) and stage 3 of every building (warm-started
+    # from the local search schedule), with and without the ordering of interchangeable rooms
+    masters = searchUpstream(data)
+    print("%-10s %-6s %-10s %10s %12s %12s %8s %10s" % ("", "stage", "building", "constraints", "objective", "bound", "nodes", "time (s)"))
+    for symmetry in [False, True]:
+        name = "symmetry" if symmetry else "none"
+        runs = [(1, data, None, heuristic.assignment(data))] + [(3, builder.warmupData(data, m), m, m) for m in masters]
+        for stage, instance, warmup, start in runs:
+            model = builder.buildModel(instance, stage, warmup=warmup, options={"symmetry": symmetry})
+            variables, constraints = countModel(model)
+            warmstart.apply(model, start)
+            mip = solveTimed(model, stage, warm=True)
+            print("%-10s %-6d %-10s %10d %12s %12s %8s %10.3f" % (name, stage, "all" if warmup is None else warmup["buildingId"], constraints,
+                                                                 "-" if mip["objective"] is None else "%.3f" % mip["objective"],
+                                                                 "-" if not isinstance(mip["bound"], (int, float)) else "%.3f" % mip["bound"],
+                                                                 "-" if mip["nodes"] is None else mip["nodes"], mip["time"]))
+
+
+# =================================================
+#   Scaling
+# =================================================
+
+def measured(task, *params):
+    out = task(*params)
+    out["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return out
+
+
+def isolated(task, *params):
+    # Every measurement runs in a fresh interpreter, so that the peak RSS is the one of that task
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(measured, task, *params).result()
+
+
+def firstIncumbent(model, stage):
+    # Cold solve stopped at the first improving solution (None when there is none in the time limit)
+    backend = solver.stageBackend(args.sv, stage)
+    opt = solver.getSolver(backend, args.mt, timelimit=args.tl, solutions=1)
+    start = time.perf_counter()
+    results, timing = solver.solve(backend, opt, model, "benchmark.log")
+    elapsed = time.perf_counter() - start
+    return elapsed if solver.hasSolution(results, model.objective.sense) else None
+
+
+def scaleHeuristic(data):
+    try:
+        start = time.perf_counter()
+        greedy = heuristic.assignment(data)
+        middle = time.perf_counter()
+        state = localsearch.search(data, iterations=args.it)
+    except Exception as e:
+        return {"error": str(e)}
+    return {"greedy": middle - start, "localsearch": time.perf_counter() - middle, "objective": greedy["objective"]["value"], "objectives": state["objectives"]}
+
+
+def scaleStage(data, stage, warmup=None, mip3=None):
+    start = time.perf_counter()
+    model = builder.buildModel(data if stage <= 2 else builder.warmupData(data, warmup), stage, warmup=warmup, mip3=mip3)
+    out = {"build": time.perf_counter() - start}
+    out["variables"], out["constraints"] = countModel(model)
+    out["first"] = firstIncumbent(model, stage)
+
+    if warmup is not None:
+        warmstart.apply(model, warmup)
+    out["mip"] = solveTimed(model, stage, warm=warmup is not None)
+    out["gap"] = solver.relativeGap(out["mip"]["objective"], out["mip"]["bound"])
+    if out["gap"] is not None and stage >= 3:
+        out["result"] = pipeline.exportBuilding(model, stage, warmup["buildingId"])
+    return out
+
+
+def printScale(streams, name, run):
+    mip = run.get("mip", {})
+    print("%-8d %-10s %10s %10.1f %10s %12s %10s %12s %12s %8s %10s" % (streams, name, "-" if "build" not in run else "%.3f" % run["build"], run["rss"],
+                                                                       run.get("variables", "-"), run.get("constraints", "-"),
+                                                                       "-" if run.get("first") is None else "%.3f" % run["first"],
+                                                                       "-" if mip.get("objective") is None else "%.3f" % mip["objective"],
+                                                                       "-" if not isinstance(mip.get("bound"), (int, float)) else "%.3f" % mip["bound"],
+                                                                       "-" if run.get("gap") is None else "%.1f%%" % (100 * run["gap"]),
+                                                                       "-" if "time" not in mip else "%.3f" % mip["time"]))
+
+
+def benchScaling(data):
+    # Generated instances of growing size (data is only the template of the proportions): peak RSS,
+    # build time, size, time to the first incumbent (cold), then objective, bound and gap after
+    # the solve under the stage gap and time limit, warm-started like the pipeline. Stage 2 starts
+    # from the greedy schedule, stages 3 to 5 run on the largest building of the local search
+    # schedule and chain their own results.
+    stages = [int(i) for i in args.sg.split(",")]
+    print("%-8s %-10s %10s %10s %10s %12s %10s %12s %12s %8s %10s" % ("streams", "run", "build (s)", "RSS (MB)", "variables", "constraints", "first (s)", "objective", "bound", "gap", "time (s)"))
+
+    for streams in [int(i) for i in args.sz.split(",")]:
+        scale = streams / float(len(data["streams"]))
+        instanceData = instance.validate(generator.generate(streams=streams, rooms=max(2, round(scale * len(data["rooms"]))), buildings=max(2, round(scale * len(data["buildings"]))),
+                                                            areas=max(2, round(scale * len(data["areas"]))), nDays=len(data["days"]), timeslots=len(data["timeslots"])))
+
+        run = isolated(scaleHeuristic, instanceData)
+        if "error" in run:
+            logging.warning("[%s] heuristic failed on %d streams: %s" % (datetime.now(), streams, run["error"]))
+        else:
+            logging.info("[%s] greedy %.3fs (objective %s), local search %.3fs (objectives %s)" % (datetime.now(), run["greedy"], run["objective"], run["localsearch"], run["objectives"]))
+        printScale(streams, "heuristic", {"rss": run["rss"]} if "error" in run else {"rss": run["rss"], "mip": {"objective": run["objectives"][0], "time": run["greedy"] + run["localsearch"]}})
+
+        if 1 in stages:
+            printScale(streams, "mip1", isolated(scaleStage, instanceData, 1))
+        if 2 in stages and "error" not in run:
+            printScale(streams, "mip2", isolated(scaleStage, instanceData, 2, heuristic.assignment(instanceData)))
+
+        if "error" in run or len([s for s in stages if s >= 3]) == 0:
+            continue
+        masters = searchUpstream(instanceData, iterations=args.it)
+        warmup = max(masters, key=lambda m: len(m["streams"]))
+        results = {}
+        for stage in [3, 4, 5]:
+            if stage not in stages:
+                break
+            run = isolated(scaleStage, instanceData, stage, warmup, results.get(3))
+            printScale(streams, "mip%d b=%d" % (stage, warmup["buildingId"]), run)
+            if "result" not in run:
+                break
+            results[stage] = warmup = run["result"]
+
+
+benchmarks = {
+    "build": benchBuild,
+    "formulation": benchFormulation,
+    "gaps": benchGaps,
+    "symmetry": benchSymmetry,
+    "scaling": benchScaling,
+}
+
+
+if __name__ == '__main__':
+
+    data = instance.load(args.rd)
+
+    logging.info("[%s] benchmark %s on %s" % (datetime.now(), args.m, args.rd))
+
+    benchmarks[args.m](data)
@@ -0,0 +1,65 @@
+import time, instance, solver
+
+# Wall-clock budget of a run. settings["budget"] (seconds) becomes a deadline when the run (or a
+# single stage script) starts; every solve then gets the share of the time left that its stage
+# weighs among the stages still to run, so the time a stage does not use goes to the next ones.
+# Stages 3 to 5 run per building: each chain gets a deadline from its size (sessions x rooms)
+# among the chains not started yet (times the workers when they run concurrently). The
+# stage time limits of solver.limits stay caps. Their gaps stay the targets while the stages keep
+# to the plan; when the earlier stages overran, the time left is short of what the plan kept for
+# the stages still to run, and the gap of the solve is relaxed by that ratio (at most to loose).
+# The budget does not stop a solve on a stalled gap by itself (settings["stall"] does).
+
+weights = {1: 3.0, 2: 2.0, 3: 1.0, 4: 2.0, 5: 2.0}
+
+# Seconds a solve gets at least, and share of the stage time kept for the export
+minimum = 5.0
+reserve = 0.05
+
+# Gap relaxed from (the solver default for the stages solved to optimality), and its largest value
+exact = 1e-4
+loose = 0.25
+
+
+def start(settings, stage=1):
+    if settings is None or not settings.get("budget") or settings.get("deadline"):
+        return settings
+    now = time.time()
+    return dict(settings, deadline=now + settings["budget"], planned=(now, stage))
+
+
+def left(stage, first):
+    # Weight of the stages from stage on among the stages from first on
+    return sum(weights[k] for k in weights if k >= stage) / sum(weights[k] for k in weights if k >= first)
+
+
+def limits(settings, stage):
+    # (time limit, relative gap) of a solve of the stage
+    timelimit, mipgap = solver.limits[stage]
+    if settings is None or not settings.get("deadline"):
+        return timelimit, mipgap
+
+    now = time.time()
+    remaining = settings["deadline"] - now
+    share = weights[stage] / sum(weights[k] for k in weights if k >= stage)
+    allocated = max(minimum, remaining * share * (1 - reserve))
+
+    begun, first = settings.get("planned", (now, stage))
+    pace = remaining / max(1e-9, (settings["deadline"] - begun) * left(stage, first))
+    if pace < 1 - reserve:
+        mipgap = min(loose, (mipgap or exact) / max(pace, 1e-3))
+    return (allocated if timelimit is None else min(timelimit, allocated)), mipgap
+
+
+def buildingSize(data, master):
+    index = instance.indexes(data)
+    return sum(index["streams"][s]["sessions"] for s in master["streams"]) * max(1, len(index["roomsByBuilding"].get(master["buildingId"], [])))
+
+
+def chain(settings, size, pending, workers=1):
+    # Settings of a building chain: its share of the time left, by size among the pending chains
+    if settings is None or not settings.get("deadline"):
+        return settings
+    now = time.time()
+    share = min(1.0, workers * size / float(max(pending, 1)))
+    return dict(settings, deadline=now + max(0.0, settings["deadline"] - now) * share, planned=(now, 3))
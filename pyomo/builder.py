@@ -0,0 +1,521 @@
+import time, numpy, instance, warmstart
+import pyomo.environ as pyo
+
+docs = {
+    1: "MIP model[1/5]: Unique buildings to streams and areas",
+    2: "MIP model[2/5]: Co-allocation of related areas",
+    3: "MIP model[3/5]: Room stability",
+    4: "MIP model[4/5]: Gaps in stream minimizing",
+    5: "MIP model[5/5]: Room utility maximization",
+}
+
+
+# =================================================
+#   Warmup data
+# =================================================
+
+def warmupData(data, warmup):
+    out = dict(data)
+    areas = set(warmup["areas"])
+    streams = set(warmup["streams"])
+    out["buildings"] = [i for i in data["buildings"] if i["id"] == warmup["buildingId"]]
+    out["rooms"] = [i for i in data["rooms"] if i["buildingId"] == warmup["buildingId"]]
+    out["areas"] = [i for i in data["areas"] if i["id"] in areas]
+    out["streams"] = [i for i in data["streams"] if i["id"] in streams]
+    return out
+
+
+# =================================================
+#   Timings
+# =================================================
+
+def charge(timings, name, start):
+    # Time since start added to timings[name] when a timings dict is given, returns the new start
+    now = time.perf_counter()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + now - start
+    return now
+
+
+# =================================================
+#   Utility
+# =================================================
+
+utilityCache = {}
+
+
+def utilityMatrix(data):
+    # Room utility log(max / att) of mip5 as a streams x rooms array (rows and columns in the order
+    # of data["streams"] and data["rooms"]), computed once per instance
+    key = (tuple((s["id"], int(s["att"])) for s in data["streams"]), tuple((r["id"], int(r["max"])) for r in data["rooms"]))
+    if key not in utilityCache:
+        att = numpy.array([int(s["att"]) for s in data["streams"]], dtype=float)
+        cap = numpy.array([int(r["max"]) for r in data["rooms"]], dtype=float)
+        relativeError = ((cap[None, :] - att[:, None]) / att[:, None]) + 1
+        utilityCache[key] = numpy.around(numpy.log(relativeError), decimals=6)
+    return utilityCache[key]
+
+
+def utilityLookup(data):
+    matrix = utilityMatrix(data)
+    streamPos = {s["id"]: k for k, s in enumerate(data["streams"])}
+    roomPos = {r["id"]: k for k, r in enumerate(data["rooms"])}
+    return lambda model, a, s, b, r: float(matrix[streamPos[s], roomPos[r]])
+
+
+# =================================================
+#   Core index
+# =================================================
+
+def coreIndex(data):
+    index = instance.indexes(data)
+    idx = {
+        "areas": [i["id"] for i in data["areas"]],
+        "streams": [i["id"] for i in data["streams"]],
+        "buildings": [i["id"] for i in data["buildings"]],
+        "rooms": [i["id"] for i in data["rooms"]],
+        "days": [i["code"] for i in data["days"]],
+        "timeslots": [i for i in data["timeslots"]],
+        "dxt": [(i["day"], i["timeslot"]) for i in data["daysXtimeslots"]],
+        "AS": {a: [s["id"] for s in index["streamsByArea"][a]] for a in index["streamsByArea"]},
+        "BR": {b: [r["id"] for r in index["roomsByBuilding"][b]] for b in index["roomsByBuilding"]},
+        "roomsFit": {},
+        "streamsFit": {},
+    }
+
+    idx["axs"] = [(a, s) for a in idx["areas"] for s in idx["AS"][a]]
+    idx["bxr"] = [(b, r) for b in idx["buildings"] for r in idx["BR"][b]]
+
+    idx["asxbr"] = []
+    for s in data["streams"]:
+        for r in data["rooms"]:
+            if int(r["max"]) >= int(s["att"]):
+                idx["asxbr"].append((s["areaId"], s["id"], r["buildingId"], r["id"]))
+    for a, s, b, r in idx["asxbr"]:
+        idx["roomsFit"].setdefault((a, s, b), []).append(r)
+        idx["streamsFit"].setdefault((b, r), []).append((a, s))
+
+    related = set()
+    for a, a_ in data["areasMatrix"]:
+        related.add((a, a_))
+        related.add((a_, a))
+
+    idx["sessions"] = {s["id"]: s["sessions"] for s in data["streams"]}
+    idx["attendants"] = {s["id"]: s["att"] for s in data["streams"]}
+    idx["areasMatrix"] = {(a, a_): 1 if (a, a_) in related else 0 for a in idx["areas"] for a_ in idx["areas"]}
+    idx["maxRooms"] = {(r["buildingId"], r["id"]): r["max"] for r in data["rooms"]}
+    idx["shifts"] = index["slots"]
+
+    # Interchangeable rooms (same building and capacity), as consecutive pairs of each class
+    classes = {}
+    for r in data["rooms"]:
+        classes.setdefault((r["buildingId"], int(r["max"])), []).append(r["id"])
+    idx["roomClasses"] = [rooms for rooms in classes.values() if len(rooms) > 1]
+    idx["twins"] = [(b, r, r_) for (b, size), rooms in classes.items() for r, r_ in zip(rooms, rooms[1:])]
+
+    return idx
+
+
+# =================================================
+#   Constraints
+# =================================================
+
+def const2(model, a, s):
+    return sum(model.Y[(a, s, b)] for b in model.B) == 1
+
+
+def const3(model, b, r, d, t):
+    if len(model.FS[b, r]) == 0:
+        return pyo.Constraint.Skip
+    return sum(model.X[(a, s, b, r, d, t)] for a, s in model.FS[b, r]) <= 1
+
+
+def const4(model, a, s):
+    return sum(model.X[(a, s, b, r, d, t)] for d, t in model.DxT for b in model.B for r in model.FR[a, s, b]) \
+           == model.N[s]
+
+
+def const5(model, a, s, d, t):
+    return sum(model.X[(a, s, b, r, d, t)] for b in model.B for r in model.FR[a, s, b]) <= 1
+
+
+def const6(model, a, b):
+    return sum(model.X[(a, s, b, r, d, t)] for d, t in model.DxT for s in model.AS[a] for r in model.FR[a, s, b]) \
+           <= model.CAP[(a, b)] * model.Q[(a, b)]
+
+
+def const7(model, a, s, b):
+    return sum(model.X[(a, s, b, r, d, t)] for d, t in model.DxT for r in model.FR[a, s, b]) \
+           <= model.N[s] * model.Y[(a, s, b)]
+
+
+def const8(model, a, a_, b):
+    return model.V[(a, a_, b)] <= model.Q[(a, b)]
+
+
+def const9(model, a, a_, b):
+    return model.V[(a, a_, b)] <= model.Q[(a_, b)]
+
+
+def const10(model, a, s, b, r):
+    return sum(model.X[(a, s, b, r, d, t)] for d, t in model.DxT) <= model.N[s] * model.U[(a, s, b, r)]
+
+
+def const11(model, a, s, d, t):
+    used = sum(model.X[(a, s, b, r, d, t)] for b in model.B for r in model.FR[a, s, b])
+    return model.FIRST[(a, s)] <= (model.VAL[(d, t)] * used) + (pyo.value(model.M) * (1 - used))
+
+
+def const12(model, a, s, d, t):
+    return model.LAST[(a, s)] >= model.VAL[(d, t)] * sum(model.X[(a, s, b, r, d, t)] for b in model.B for r in model.FR[a, s, b])
+
+
+# Time-indexed alternative to const11/const12: START and END mark the first and last slot of each
+# stream, the span between them (slots after START and not after END) covers every session.
+
+def sessionAt(model, a, s, d, t):
+    return sum(model.X[(a, s, b, r, d, t)] for b in model.B for r in model.FR[a, s, b])
+
+
+def span(model, a, s, d, t):
+    return sum(model.START[(a, s, d_, t_)] for d_, t_ in model.UPTO[d, t]) \
+           - sum(model.END[(a, s, d_, t_)] for d_, t_ in model.UPTO[d, t] if (d_, t_) != (d, t))
+
+
+def const11t(model, a, s):
+    return model.FIRST[(a, s)] == sum(model.VAL[(d, t)] * model.START[(a, s, d, t)] for d, t in model.DxT)
+
+
+def const12t(model, a, s):
+    return model.LAST[(a, s)] == sum(model.VAL[(d, t)] * model.END[(a, s, d, t)] for d, t in model.DxT)
+
+
+def const15(model, a, s):
+    return sum(model.START[(a, s, d, t)] for d, t in model.DxT) == 1
+
+
+def const16(model, a, s):
+    return sum(model.END[(a, s, d, t)] for d, t in model.DxT) == 1
+
+
+def const17(model, a, s, d, t):
+    return sessionAt(model, a, s, d, t) <= span(model, a, s, d, t)
+
+
+def const18(model, a, s, d, t):
+    return span(model, a, s, d, t) >= 0
+
+
+# Symmetry breaking between interchangeable rooms r < r_ (twins): r is at least as occupied as r_
+# at every slot (stages 1 and 2, where only the building matters) or over the whole conference
+# (stages 3 to 5, where a stream keeps its rooms across slots).
+
+def occupancy(model, b, r, d, t):
+    return sum(model.X[(a, s, b, r, d, t)] for a, s in model.FS[b, r])
+
+
+def const19(model, b, r, r_, d, t):
+    return occupancy(model, b, r, d, t) >= occupancy(model, b, r_, d, t)
+
+
+def const20(model, b, r, r_):
+    return sum(occupancy(model, b, r, d, t) for d, t in model.DxT) >= sum(occupancy(model, b, r_, d, t) for d, t in model.DxT)
+
+
+# =================================================
+#   Objectives
+# =================================================
+
+def buildingsObjective(model):
+    return sum((sum(model.Q[(a, b)] for b in model.B) - 1) for a in model.A)
+
+
+def colocationObjective(model):
+    return sum(model.I[(a, a_)] * model.V[(a, a_, b)] for b in model.B for a, a_ in model.AV)
+
+
+def roomsObjective(model):
+    return sum((sum(model.U[(a, s, b, r)] for b in model.B for r in model.FR[a, s, b]) - 1) for a, s in model.AxS)
+
+
+def gapsObjective(model):
+    return sum(model.LAST[(a, s)] - model.FIRST[(a, s)] - model.N[s] + 1 for a, s in model.AxS)
+
+
+def utilityObjective(model):
+    return sum(model.UTIL[(a, s, b, r)] * model.X[(a, s, b, r, d, t)] for d, t in model.DxT for a, s, b, r in model.ASxBR)
+
+
+objectives = {
+    1: (buildingsObjective, pyo.minimize),
+    2: (colocationObjective, pyo.maximize),
+    3: (roomsObjective, pyo.minimize),
+    4: (gapsObjective, pyo.minimize),
+    5: (utilityObjective, pyo.maximize),
+}
+
+
+# =================================================
+#   Model
+# =================================================
+
+def capacities(idx, tight):
+    # Bound on the sessions of area a in building b (big-M of const6): every slot of every room by
+    # default, else the sessions of the streams of a that fit in b, at most every slot of the rooms
+    # of b that fit one of them
+    cap = {}
+    for a in idx["areas"]:
+        for b in idx["buildings"]:
+            if not tight:
+                cap[(a, b)] = len(idx["dxt"]) * len(idx["rooms"])
+                continue
+            rooms = set()
+            sessions = 0
+            for s in idx["AS"][a]:
+                fit = idx["roomsFit"].get((a, s, b), [])
+                rooms.update(fit)
+                sessions += idx["sessions"][s] if len(fit) > 0 else 0
+            cap[(a, b)] = min(sessions, len(idx["dxt"]) * len(rooms))
+    return cap
+
+
+def splitAreas(idx, warmup):
+    # Areas spread over several buildings by mip1
+    qData = {}
+    for (a, b), v in warmstart.nonzeros(warmup, "Q"):
+        qData[(int(a), int(b))] = int(v)
+    return [a for a in idx["areas"] if sum(qData.get((a, b), 0) for b in idx["buildings"]) > 1]
+
+
+def buildModel(data, stage, warmup=None, mip3=None, idx=None, options=None, timings=None, bounds=True):
+    # options (the pipeline settings): "formulation" is "default" or "tight" (V only on the related
+    # area pairs and per-building big-M in const6), "gaps" is "bigm" or "time" (FIRST/LAST of stages
+    # 4 and 5 with big-M const11/const12 or with the time-indexed START/END), "symmetry" adds the
+    # ordering of interchangeable rooms. timings gets the time of the sets, parameters and
+    # variables ("sets") and of the constraints and objective ("constraints"). bounds=False leaves
+    # out the bounds on the upstream objectives of stages 4 and 5 (added by lexico.py as it goes).
+    # "fixed" takes the building assignment of mip2 as data in the models of stages 3 to 5 (one
+    # building, all of its streams and areas): Y and Q are parameters set to 1, V and the linking
+    # constraints const2 and const6 to const9 are left out.
+    start = time.perf_counter()
+    options = {} if options is None else options
+    tight = options.get("formulation", "default") == "tight"
+    timeIndexed = options.get("gaps", "bigm") == "time"
+    idx = coreIndex(data) if idx is None else idx
+    dxt = idx["dxt"]
+    fixed = stage >= 3 and options.get("fixed", False) and len(idx["buildings"]) == 1
+
+    model = pyo.ConcreteModel(doc=docs[stage])
+
+    model.A = pyo.Set(initialize=idx["areas"], domain=pyo.NonNegativeIntegers)
+    model.S = pyo.Set(initialize=idx["streams"], domain=pyo.NonNegativeIntegers)
+    model.AS = pyo.Set(model.A, initialize=idx["AS"], domain=model.S)
+
+    model.B = pyo.Set(initialize=idx["buildings"], domain=pyo.NonNegativeIntegers)
+    model.R = pyo.Set(initialize=idx["rooms"], domain=pyo.NonNegativeIntegers)
+    model.BR = pyo.Set(model.B, initialize=idx["BR"], domain=model.R)
+    model.D = pyo.Set(initialize=idx["days"])
+    model.T = pyo.Set(initialize=idx["timeslots"])
+
+    model.AxS = pyo.Set(initialize=idx["axs"], dimen=2)
+    model.BxR = pyo.Set(initialize=idx["bxr"], dimen=2)
+    model.DxT = pyo.Set(initialize=dxt, dimen=2)
+
+    model.ASxBR = pyo.Set(initialize=idx["asxbr"], dimen=4)
+    model.FR = pyo.Set(model.AxS, model.B, initialize=lambda m, a, s, b: idx["roomsFit"].get((a, s, b), []))
+    model.FS = pyo.Set(model.BxR, initialize=lambda m, b, r: idx["streamsFit"].get((b, r), []), dimen=2)
+
+    if tight:
+        model.AV = pyo.Set(initialize=[(a, a_) for a in idx["areas"] for a_ in idx["areas"] if idx["areasMatrix"][(a, a_)] == 1], dimen=2)
+    else:
+        model.AV = pyo.Set(initialize=[(a, a_) for a in idx["areas"] for a_ in idx["areas"]], dimen=2)
+
+    if stage == 2:
+        model.vAAB = pyo.Set(initialize=splitAreas(idx, warmup), domain=model.A)
+
+    model.N = pyo.Param(model.S, initialize=idx["sessions"], domain=pyo.NonNegativeIntegers)
+    model.P = pyo.Param(model.S, initialize=idx["attendants"], domain=pyo.NonNegativeIntegers)
+    model.I = pyo.Param(model.A, model.A, initialize=idx["areasMatrix"], domain=pyo.NonNegativeIntegers)
+    model.RS = pyo.Param(model.BxR, initialize=idx["maxRooms"], domain=pyo.NonNegativeIntegers)
+    model.VAL = pyo.Param(model.DxT, initialize=idx["shifts"], domain=pyo.NonNegativeIntegers)
+    model.ISUM = pyo.Param(default=int(sum(idx["areasMatrix"].values()) / 2), domain=pyo.NonNegativeIntegers)
+    model.M = pyo.Param(default=len(dxt), domain=pyo.NonNegativeIntegers)
+    model.CAP = pyo.Param(model.A, model.B, initialize=capacities(idx, tight), domain=pyo.NonNegativeIntegers)
+    if stage == 5:
+        model.UTIL = pyo.Param(model.ASxBR, initialize=utilityLookup(data), domain=pyo.Reals)
+
+    model.X = pyo.Var(model.ASxBR, model.DxT, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+    if fixed:
+        model.Y = pyo.Param(model.AxS, model.B, default=1, domain=pyo.Binary)
+        model.Q = pyo.Param(model.A, model.B, default=1, domain=pyo.Binary)
+    else:
+        model.Y = pyo.Var(model.AxS, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+        model.Q = pyo.Var(model.A, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+        model.V = pyo.Var(model.AV, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+    model.U = pyo.Var(model.ASxBR, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+    model.FIRST = pyo.Var(model.AxS, domain=pyo.NonNegativeIntegers, bounds=(1, len(dxt)))
+    model.LAST = pyo.Var(model.AxS, domain=pyo.NonNegativeIntegers, bounds=(1, len(dxt)))
+    start = charge(timings, "sets", start)
+
+    if not fixed:
+        model.const2 = pyo.Constraint(model.AxS, rule=const2)
+    model.const3 = pyo.Constraint(model.BxR, model.DxT, rule=const3)
+    model.const4 = pyo.Constraint(model.AxS, rule=const4)
+    model.const5 = pyo.Constraint(model.AxS, model.DxT, rule=const5)
+    if not fixed:
+        model.const6 = pyo.Constraint(model.A, model.B, rule=const6)
+        model.const7 = pyo.Constraint(model.AxS, model.B, rule=const7)
+
+    if stage >= 2 and not fixed:
+        model.const8 = pyo.Constraint(model.AV, model.B, rule=const8)
+        model.const9 = pyo.Constraint(model.AV, model.B, rule=const9)
+    if stage >= 2:
+        model.const10 = pyo.Constraint(model.ASxBR, rule=const10)
+
+    if stage >= 4 and timeIndexed:
+        model.UPTO = pyo.Set(model.DxT, initialize=lambda m, d, t: [i for i in dxt if idx["shifts"][i] <= idx["shifts"][(d, t)]], dimen=2)
+        model.START = pyo.Var(model.AxS, model.DxT, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+        model.END = pyo.Var(model.AxS, model.DxT, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+        model.const11 = pyo.Constraint(model.AxS, rule=const11t)
+        model.const12 = pyo.Constraint(model.AxS, rule=const12t)
+        model.const15 = pyo.Constraint(model.AxS, rule=const15)
+        model.const16 = pyo.Constraint(model.AxS, rule=const16)
+        model.const17 = pyo.Constraint(model.AxS, model.DxT, rule=const17)
+        model.const18 = pyo.Constraint(model.AxS, model.DxT, rule=const18)
+    elif stage >= 4:
+        model.const11 = pyo.Constraint(model.AxS, model.DxT, rule=const11)
+        model.const12 = pyo.Constraint(model.AxS, model.DxT, rule=const12)
+
+    if options.get("symmetry", False):
+        model.TWINS = pyo.Set(initialize=idx["twins"], dimen=3)
+        if stage <= 2:
+            model.const19 = pyo.Constraint(model.TWINS, model.DxT, rule=const19)
+        else:
+            model.const20 = pyo.Constraint(model.TWINS, rule=const20)
+
+    if stage == 2:
+        model.const13 = pyo.Constraint(expr=buildingsObjective(model) <= float(warmup["objective"]["value"]))
+        model.const14 = pyo.Constraint(model.vAAB, model.vAAB, model.B, rule=lambda m, a, a_, b: m.V[(a, a_, b)] == 0 if (a, a_) in m.AV else pyo.Constraint.Skip)
+    elif stage == 4 and bounds:
+        model.const13 = pyo.Constraint(expr=roomsObjective(model) <= float(warmup["objective"]["value"]))
+    elif stage == 5 and bounds:
+        model.const13 = pyo.Constraint(expr=gapsObjective(model) <= round(warmup["objective"]["value"]))
+        model.const14 = pyo.Constraint(expr=roomsObjective(model) <= round(mip3["objective"]["value"]))
+
+    rule, sense = objectives[stage]
+    model.objective = pyo.Objective(rule=rule, sense=sense)
+    charge(timings, "constraints", start)
+
+    return model
+
+
+# =================================================
+#   Aggregated model (stages 1 and 2)
+# =================================================
+
+# Stages 1 and 2 only decide the building of each stream. Fitting rooms are nested (a stream fits
+# every room at least as large as its attendance), so the sessions given to a building can be laid
+# out in its rooms and slots as long as, for every room capacity c of the building, the sessions of
+# the streams that need a room of at least c fill no more than every slot of those rooms. The
+# aggregated model keeps Y, Q (and V) with these capacity rows instead of X; disaggregate() rebuilds
+# X with that layout.
+
+def capacityLevels(data):
+    rooms = {}
+    for r in data["rooms"]:
+        rooms.setdefault(r["buildingId"], []).append(int(r["max"]))
+
+    levels = {}
+    for b in rooms:
+        sizes = sorted(set(rooms[b]), reverse=True)
+        for k, c in enumerate(sizes):
+            below = sizes[k + 1] if k + 1 < len(sizes) else 0
+            levels[(b, k)] = {"rooms": sum(1 for m in rooms[b] if m >= c),
+                              "streams": [(s["areaId"], s["id"]) for s in data["streams"] if below < int(s["att"]) <= sizes[0]]}
+    return levels
+
+
+def const21(model, b, k):
+    if len(model.LS[b, k]) == 0:
+        return pyo.Constraint.Skip
+    return sum(model.N[s] * model.Y[(a, s, b)] for a, s in model.LS[b, k]) <= len(model.DxT) * model.LR[(b, k)]
+
+
+def const22(model, a, s, b):
+    if len(model.FR[a, s, b]) == 0:
+        return model.Y[(a, s, b)] == 0
+    return model.Y[(a, s, b)] <= model.Q[(a, b)]
+
+
+def buildAggregatedModel(data, stage, warmup=None, idx=None, options=None, timings=None):
+    start = time.perf_counter()
+    options = {} if options is None else options
+    tight = options.get("formulation", "default") == "tight"
+    idx = coreIndex(data) if idx is None else idx
+    levels = capacityLevels(data)
+
+    model = pyo.ConcreteModel(doc="%s (aggregated)" % docs[stage])
+
+    model.A = pyo.Set(initialize=idx["areas"], domain=pyo.NonNegativeIntegers)
+    model.S = pyo.Set(initialize=idx["streams"], domain=pyo.NonNegativeIntegers)
+    model.AS = pyo.Set(model.A, initialize=idx["AS"], domain=model.S)
+    model.B = pyo.Set(initialize=idx["buildings"], domain=pyo.NonNegativeIntegers)
+    model.AxS = pyo.Set(initialize=idx["axs"], dimen=2)
+    model.DxT = pyo.Set(initialize=idx["dxt"], dimen=2)
+    model.FR = pyo.Set(model.AxS, model.B, initialize=lambda m, a, s, b: idx["roomsFit"].get((a, s, b), []))
+    model.L = pyo.Set(initialize=list(levels), dimen=2)
+    model.LS = pyo.Set(model.L, initialize=lambda m, b, k: levels[(b, k)]["streams"], dimen=2)
+
+    if tight:
+        model.AV = pyo.Set(initialize=[(a, a_) for a in idx["areas"] for a_ in idx["areas"] if idx["areasMatrix"][(a, a_)] == 1], dimen=2)
+    else:
+        model.AV = pyo.Set(initialize=[(a, a_) for a in idx["areas"] for a_ in idx["areas"]], dimen=2)
+
+    if stage == 2:
+        model.vAAB = pyo.Set(initialize=splitAreas(idx, warmup), domain=model.A)
+
+    model.N = pyo.Param(model.S, initialize=idx["sessions"], domain=pyo.NonNegativeIntegers)
+    model.I = pyo.Param(model.A, model.A, initialize=idx["areasMatrix"], domain=pyo.NonNegativeIntegers)
+    model.LR = pyo.Param(model.L, initialize={i: levels[i]["rooms"] for i in levels}, domain=pyo.NonNegativeIntegers)
+
+    model.Y = pyo.Var(model.AxS, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+    model.Q = pyo.Var(model.A, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+    start = charge(timings, "sets", start)
+
+    model.const2 = pyo.Constraint(model.AxS, rule=const2)
+    model.const21 = pyo.Constraint(model.L, rule=const21)
+    model.const22 = pyo.Constraint(model.AxS, model.B, rule=const22)
+
+    if stage == 2:
+        model.V = pyo.Var(model.AV, model.B, domain=pyo.NonNegativeIntegers, bounds=(0, 1))
+        model.const8 = pyo.Constraint(model.AV, model.B, rule=const8)
+        model.const9 = pyo.Constraint(model.AV, model.B, rule=const9)
+        model.const13 = pyo.Constraint(expr=buildingsObjective(model) <= float(warmup["objective"]["value"]))
+        model.const14 = pyo.Constraint(model.vAAB, model.vAAB, model.B, rule=lambda m, a, a_, b: m.V[(a, a_, b)] == 0 if (a, a_) in m.AV else pyo.Constraint.Skip)
+
+    rule, sense = objectives[stage]
+    model.objective = pyo.Objective(rule=rule, sense=sense)
+    charge(timings, "constraints", start)
+
+    return model
+
+
+def disaggregate(data, assigned):
+    # X of the (area, stream, building) assignment: in each building, the streams by decreasing
+    # attendance take consecutive positions of its rooms (by decreasing capacity) x slots, wrapping
+    # to the next room after the last slot, so that the sessions of a stream get distinct slots
+    index = instance.indexes(data)
+    dxt = index["dxt"]
+    streams = index["streams"]
+    rooms = {}
+    for r in sorted(data["rooms"], key=lambda r: int(r["max"]), reverse=True):
+        rooms.setdefault(r["buildingId"], []).append(r["id"])
+
+    x = []
+    position = {b: 0 for b in rooms}
+    for a, s, b in sorted(assigned, key=lambda i: (int(streams[i[1]]["att"]), streams[i[1]]["sessions"]), reverse=True):
+        for n in range(streams[s]["sessions"]):
+            p = position[b]
+            x.append((a, s, b, rooms[b][p // len(dxt)]) + dxt[p % len(dxt)])
+            position[b] += 1
+    return x
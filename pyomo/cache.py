@@ -0,0 +1,137 @@
+import os, json, time, shutil, hashlib, logging, builder, solver, solution, warmstart
+import pyomo.environ as pyo
+from datetime import datetime
+
+# Content-addressed cache of stage results. The key of a stage run is a hash of what the stage
+# reads: the instance (the building subset for stages 3 to 5), the stage, the solver backend and
+# limits, the options the stage reads and the upstream results (in canonical form: nonzero values
+# only, sorted, so that a result read back from the cache hashes like the one that was solved). An
+# entry is a directory <cache>/<key> holding the results in the compact format and entry.json; the
+# least recently used entries are removed when the cache grows over its size limit. Only results
+# proven within the target gap of the stage are stored: the key has no wall-clock settings, so a
+# run cut short by the stall detection, the budget or a time limit would be served for later runs
+# that have the time to finish.
+
+# Options read by the model builder of each stage: the options of the earlier stages are already in
+# the upstream results, and the wall-clock settings (stall, budget) are not part of the key
+options = {
+    1: ["formulation", "symmetry", "aggregate", "heuristic", "localsearch"],
+    2: ["formulation", "symmetry", "aggregate"],
+    3: ["formulation", "symmetry", "lexico", "fixed"],
+    4: ["formulation", "gaps", "symmetry", "lexico", "fixed"],
+    5: ["formulation", "gaps", "symmetry", "lexico", "fixed"],
+}
+
+
+# =================================================
+#   Key
+# =================================================
+
+def canonical(result):
+    if result is None:
+        return None
+    out = {"objective": round(float(result["objective"]["value"]), 6)}
+    for key in ["buildingId", "areas", "streams"]:
+        if key in result:
+            out[key] = sorted(result[key]) if isinstance(result[key], list) else result[key]
+    for name in warmstart.binaries + solution.integers:
+        values = sorted([list(i), int(v)] for i, v in warmstart.nonzeros(result, name))
+        if len(values) > 0:
+            out[name] = values
+    return out
+
+
+def stageKey(data, stage, settings, warmup=None, mip3=None):
+    instance = data if stage <= 2 else builder.warmupData(data, warmup)
+    # the lexicographic mip3 model already has the FIRST/LAST rows of mip4 and mip5
+    names = options[stage] + (["gaps"] if stage == 3 and settings.get("lexico", False) else [])
+    content = {
+        "instance": {key: instance[key] for key in sorted(instance)},
+        "stage": stage,
+        "solver": solver.stageBackend(settings.get("solver", "cplex"), stage),
+        "limits": solver.limits[stage],
+        "options": {key: settings[key] for key in names if key in settings},
+        "warmup": canonical(warmup),
+        "mip3": canonical(mip3),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# =================================================
+#   Entries
+# =================================================
+
+def complete(stage, model, results):
+    # True when the bound proves the incumbent within the target gap of the stage (the solver
+    # defaults of 1e-4 relative and 1e-6 absolute for the stages solved to optimality)
+    objective = pyo.value(model.objective)
+    bound = solver.bestBound(results, model.objective.sense)
+    if bound is None:
+        return False
+    gap = solver.limits[stage][1] or 1e-4
+    return abs(objective - bound) <= 1e-6 or solver.relativeGap(objective, bound) <= gap + 1e-9
+
+
+def entrySize(path):
+    # entries can be removed by a concurrent eviction (stages 3 to 5 run in several processes)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+def load(settings, key):
+    # {name: result} of a cached stage run, None on a miss
+    if settings.get("cache") is None:
+        return None
+    path = os.path.join(settings["cache"], key)
+    if not os.path.exists(os.path.join(path, "entry.json")):
+        return None
+
+    f = open(os.path.join(path, "entry.json"), "r")
+    entry = json.loads(f.read())
+    f.close()
+    os.utime(os.path.join(path, "entry.json"))
+
+    logging.info("[%s] cache hit %s (stage %d)" % (datetime.now(), key[:12], entry["stage"]))
+    return {name: solution.readResult(os.path.join(path, name)) for name in entry["results"]}
+
+
+def store(settings, key, stage, results):
+    if settings.get("cache") is None:
+        return
+    path = os.path.join(settings["cache"], key)
+    tmp = "%s.tmp%d" % (path, os.getpid())
+    for name in results:
+        solution.writeResult(tmp, name, results[name])
+    with open(os.path.join(tmp, "entry.json"), "w") as outfile:
+        json.dump({"stage": stage, "results": list(results), "created": time.time()}, outfile)
+
+    if os.path.exists(path):
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, path)
+
+    evict(settings["cache"], settings.get("cachesize", 1024) * 1024 * 1024)
+
+
+def evict(root, limit):
+    entries = []
+    for key in os.listdir(root):
+        path = os.path.join(root, key)
+        try:
+            entries.append((os.path.getmtime(os.path.join(path, "entry.json")), entrySize(path), path))
+        except OSError:
+            continue
+
+    total = sum(size for used, size, path in entries)
+    for used, size, path in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logging.info("[%s] cache evict %s (%d bytes)" % (datetime.now(), os.path.basename(path), size))
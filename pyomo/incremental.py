@@ -0,0 +1,264 @@
+import os, re, json, pathlib, logging, argparse, builder, instance, pipeline, solver, solution, warmstart
+import pyomo.environ as pyo
+from datetime import datetime
+
+# Incremental re-optimization of a final schedule (the mip_5_<b> results) after a small change of
+# the instance. The streams touched by the change are the ones added or revised (sessions, area,
+# attendance) and the ones holding a session in a withdrawn or revised room; every other stream
+# keeps its building, rooms and slots. The touched streams get a building from the aggregated
+# stages 1 and 2 with the other assignments fixed, then only the buildings whose streams changed
+# run stages 3 to 5 with the kept sessions fixed in place (the neighborhood is widened to the rooms
+# the moved streams fit in, then to the whole building, when they do not fit around them). Changes
+# of the calendar, areas or buildings touch every stream.
+
+
+# =================================================
+#   Diff
+# =================================================
+
+def byId(items):
+    return {i["id"]: i for i in items}
+
+
+def diff(old, new):
+    out = {"structural": [], "streams": [], "added": [], "removed": [], "rooms": []}
+
+    for key in ["areas", "areasMatrix", "buildings", "days", "timeslots", "daysXtimeslots"]:
+        if json.dumps(old[key], sort_keys=True) != json.dumps(new[key], sort_keys=True):
+            out["structural"].append(key)
+
+    oldStreams, newStreams = byId(old["streams"]), byId(new["streams"])
+    for s in newStreams:
+        if s not in oldStreams:
+            out["added"].append(s)
+        elif any(oldStreams[s][k] != newStreams[s][k] for k in ["sessions", "areaId", "att"]):
+            out["streams"].append(s)
+    out["removed"] = [s for s in oldStreams if s not in newStreams]
+
+    oldRooms, newRooms = byId(old["rooms"]), byId(new["rooms"])
+    for r in oldRooms:
+        if r not in newRooms or any(oldRooms[r][k] != newRooms[r][k] for k in ["buildingId", "max"]):
+            out["rooms"].append(r)
+
+    return out
+
+
+def touched(data, changes, cells):
+    # Streams to re-optimize: cells is {stream: [X index]} of the previous schedule
+    if len(changes["structural"]) > 0:
+        return set(i["id"] for i in data["streams"])
+    out = set(changes["streams"] + changes["added"])
+    rooms = set(changes["rooms"])
+    for s in cells:
+        if any(i[3] in rooms for i in cells[s]):
+            out.add(s)
+    return out - set(changes["removed"])
+
+
+# =================================================
+#   Previous schedule
+# =================================================
+
+def loadSchedule(path):
+    out = {}
+    for entry in sorted(os.listdir(path)):
+        match = re.match(r'^mip_5_(\d+)(\.json)?$', entry)
+        if match and (int(match.group(1)) not in out or os.path.isdir(os.path.join(path, entry))):
+            out[int(match.group(1))] = solution.readResult(os.path.join(path, entry))
+    return out
+
+
+def scheduleCells(schedule):
+    cells = {}
+    for b in schedule:
+        for i, v in warmstart.nonzeros(schedule[b], "X"):
+            cells.setdefault(i[1], []).append(tuple(i))
+    return cells
+
+
+# =================================================
+#   Building assignment (stages 1 and 2)
+# =================================================
+
+def fixAssignment(model, buildings):
+    # buildings: {stream: building} of the streams that stay where they are
+    for a, s, b in model.Y:
+        if s in buildings:
+            model.Y[(a, s, b)].fix(1 if buildings[s] == b else 0)
+
+
+def assignBuildings(data, buildings, wd, threads, settings):
+    model = builder.buildAggregatedModel(data, 1, options=settings)
+    fixAssignment(model, buildings)
+    results = pipeline.solveModel(model, 1, wd, threads, settings=settings, warm=False)
+    if not solver.hasSolution(results, pyo.minimize):
+        raise Exception("No building for the changed streams (%s)" % results.solver.termination_condition)
+
+    warmup = {"objective": {"value": pyo.value(model.objective)}, "Q": [pipeline.state(model.Q, i) for i in model.Q]}
+    model = builder.buildAggregatedModel(data, 2, warmup=warmup, options=settings)
+    fixAssignment(model, buildings)
+    results = pipeline.solveModel(model, 2, wd, threads, settings=settings, warm=False)
+    if not solver.hasSolution(results, pyo.maximize):
+        raise Exception("No building for the changed streams (%s)" % results.solver.termination_condition)
+
+    return {s: b for a, s, b in model.Y if round(pyo.value(model.Y[(a, s, b)])) == 1}
+
+
+# =================================================
+#   Neighborhood (stages 3 to 5)
+# =================================================
+
+def place(data, building, cells, streams):
+    # Start for the moved streams: their sessions in the free cells of the fitting rooms, largest
+    # streams first, one session per slot
+    index = instance.indexes(data)
+    dxt = index["dxt"]
+    rooms = sorted(index["roomsByBuilding"][building], key=lambda r: int(r["max"]))
+    busy = set((i[3], i[4], i[5]) for s in cells for i in cells[s])
+
+    out = {}
+    for s in sorted(streams, key=lambda s: int(s["att"]), reverse=True):
+        out[s["id"]] = []
+        for d, t in dxt:
+            free = [r["id"] for r in rooms if int(r["max"]) >= int(s["att"]) and (r["id"], d, t) not in busy]
+            if len(out[s["id"]]) < s["sessions"] and len(free) > 0:
+                out[s["id"]].append((s["areaId"], s["id"], building, free[0], d, t))
+                busy.add((free[0], d, t))
+    return out
+
+
+def fixStreams(model, cells):
+    for i in model.X:
+        if i[1] in cells:
+            model.X[i].fix(1 if i in cells[i[1]] else 0)
+
+
+def runStage(data, stage, warmup, cells, wd, threads, mip3=None, settings=None):
+    building = int(warmup["buildingId"])
+    model = builder.buildModel(builder.warmupData(data, warmup), stage, warmup=warmup, mip3=mip3, options=settings)
+    pipeline.warmupModel(model, stage, warmup, settings)
+    fixStreams(model, cells)
+    results = pipeline.solveModel(model, stage, wd, threads, building=building, settings=settings)
+    if not solver.hasSolution(results, model.objective.sense):
+        return None
+    master = pipeline.exportBuilding(model, stage, building)
+    pipeline.writeResult(wd, "mip_%d_%d" % (stage, building), master, settings=settings)
+    return master
+
+
+def neighborhoods(data, building, kept, moved):
+    # Kept sessions fixed in each attempt: all of them, then only the ones outside the rooms large
+    # enough for a moved stream, then none (the whole building)
+    index = instance.indexes(data)
+    smallest = min([int(index["streams"][s]["att"]) for s in moved] + [float("inf")])
+    rooms = set(r["id"] for r in index["roomsByBuilding"][building] if int(r["max"]) >= smallest)
+    return [kept, {s: kept[s] for s in kept if all(i[3] not in rooms for i in kept[s])}, {}]
+
+
+def runNeighborhood(data, building, streams, cells, wd, threads, settings=None):
+    # streams: the streams of the building, cells: {stream: [X index]} of the ones kept in place
+    index = instance.indexes(data)
+    kept = {s: cells[s] for s in streams if s in cells}
+    moved = place(data, building, kept, [index["streams"][s] for s in streams if s not in kept])
+    records = lambda keys: [{"tuple": i, "state": 1} for i in keys]
+    areas = sorted(set(index["streams"][s]["areaId"] for s in streams))
+    warmup = {"buildingId": building, "objective": {"value": 0}, "areas": areas, "streams": sorted(streams),
+              "X": records([i for s in list(kept.values()) + list(moved.values()) for i in s]),
+              "Y": records([(index["streams"][s]["areaId"], s, building) for s in streams]),
+              "Q": records([(a, building) for a in areas])}
+
+    logging.info("[%s] neighborhood of building %d: %d streams kept, %d moved" % (datetime.now(), building, len(kept), len(moved)))
+
+    mip3 = None
+    for kept in neighborhoods(data, building, kept, moved):
+        mip3 = runStage(data, 3, warmup, kept, wd, threads, settings=settings)
+        if mip3 is not None:
+            break
+        logging.warning("[%s] moved streams do not fit around the kept sessions of building %d, widen the neighborhood" % (datetime.now(), building))
+    if mip3 is None:
+        raise Exception("Building %d: no mip3 schedule, even with every session free" % building)
+
+    mip4 = runStage(data, 4, mip3, kept, wd, threads, settings=settings)
+    if mip4 is None:
+        raise Exception("Building %d: no mip4 incumbent from the solver" % building)
+    mip5 = runStage(data, 5, mip4, kept, wd, threads, mip3=mip3, settings=settings)
+    if mip5 is None:
+        raise Exception("Building %d: no mip5 incumbent from the solver" % building)
+    return mip5
+
+
+# =================================================
+#   Incremental run
+# =================================================
+
+def movement(previous, current):
+    # Sessions whose (building, room, slot) changed, and streams with at least one of them
+    sessions = sum(len(current[s]) for s in current)
+    moved = {s: len(set(current[s]) - set(previous.get(s, []))) for s in current}
+    return {"sessions": sessions, "movedSessions": sum(moved.values()),
+            "streams": len(current), "movedStreams": sum(1 for s in moved if moved[s] > 0),
+            "movedBuildings": sum(1 for s in current if s in previous and previous[s][0][2] != current[s][0][2])}
+
+
+def runIncremental(old, data, schedule, wd, threads, settings=None):
+    # schedule: {building: mip5 result} of the old instance, returns the new one and the report
+    settings = {} if settings is None else settings
+    changes = diff(old, data)
+    cells = scheduleCells(schedule)
+    streams = touched(data, changes, cells)
+
+    logging.info("[%s] incremental: %d streams revised, %d added, %d removed, %d rooms revised or withdrawn, structural %s" % (datetime.now(), len(changes["streams"]), len(changes["added"]),
+                                                                                                                               len(changes["removed"]), len(changes["rooms"]), changes["structural"]))
+
+    previous = {s: cells[s][0][2] for s in cells}
+    kept = {s: previous[s] for s in previous if s not in streams and s not in changes["removed"]}
+    assigned = assignBuildings(data, kept, wd, threads, settings) if len(streams) > 0 else kept
+
+    members = {}
+    for s in assigned:
+        members.setdefault(assigned[s], []).append(s)
+    buildings = [b for b in members if set(members[b]) != set(s for s in previous if previous[s] == b) or any(s in streams for s in members[b])]
+
+    out = {b: schedule[b] for b in members if b not in buildings}
+    for b in sorted(buildings, key=lambda b: len(members[b]), reverse=True):
+        out[b] = runNeighborhood(data, b, members[b], {s: cells[s] for s in kept}, wd, threads, settings=settings)
+
+    for b in out:
+        pipeline.writeResult(wd, "mip_5_%d" % b, out[b], settings=settings)
+
+    report = movement(cells, scheduleCells(out))
+    report.update({"changes": changes, "touched": sorted(streams), "buildings": sorted(buildings)})
+    return out, report
+
+
+if __name__ == '__main__':
+
+    logging.getLogger().setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-rd", "--rd", help='raw data (changed instance)', default="%s/../data/light.json" % pathlib.Path().resolve(), type=str)
+    parser.add_argument("-od", "--od", help='raw data of the previous schedule', type=str, required=True)
+    parser.add_argument("-pd", "--pd", help='directory of the previous mip_5_* results', type=str, required=True)
+    parser.add_argument("-wd", "--wd", help='working directory', default="%s/output" % pathlib.Path().resolve(), type=str)
+    parser.add_argument("-mt", "--mt", help='maximum thread', default=4, type=int)
+    parser.add_argument("-sv", "--sv", help='solver backend, or one backend per stage separated by commas', default="cplex", type=str)
+    parser.add_argument("-kf", "--kf", help='keep the solver LP/solution files (debug)', action='store_true')
+    parser.add_argument("-fm", "--fm", help='result format (npy, json or both)', default="npy", type=str)
+    parser.add_argument("-fo", "--fo", help='model formulation (default or tight)', default="default", type=str)
+    parser.add_argument("-gp", "--gp", help='FIRST/LAST formulation (bigm or time)', default="bigm", type=str)
+    args = parser.parse_args()
+
+    old = instance.load(args.od)
+    data = instance.load(args.rd)
+
+    schedule = loadSchedule(args.pd)
+    out, report = runIncremental(old, data, schedule, args.wd, args.mt,
+                                 settings={"solver": args.sv, "keepfiles": args.kf, "format": args.fm, "formulation": args.fo, "gaps": args.gp})
+
+    with open(os.path.join(args.wd, "incremental.json"), "w") as outfile:
+        json.dump(report, outfile)
+
+    print("buildings re-optimized: %s" % report["buildings"])
+    print("streams moved:          %d / %d (%d to another building)" % (report["movedStreams"], report["streams"], report["movedBuildings"]))
+    print("sessions moved:         %d / %d (%.1f%%)" % (report["movedSessions"], report["sessions"], 100.0 * report["movedSessions"] / max(report["sessions"], 1)))
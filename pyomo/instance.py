@@ -0,0 +1,90 @@
+import json
+
+# Instance loader shared by the stages, the heuristics and the visualizer. The file is parsed with
+# json.load (which reads its whole text first) and checked once against the schema: required
+# fields, integer fields cast to int, unique ids and references between the collections. The rest
+# of the code can then index the records directly; indexes() builds the lookups by id, the streams
+# of each area, the rooms of each building and the ordinal of each (day, timeslot) in one pass over
+# each collection.
+
+schema = {
+    "areas": {"id": int},
+    "streams": {"id": int, "sessions": int, "areaId": int, "att": int},
+    "buildings": {"id": int},
+    "rooms": {"id": int, "buildingId": int, "max": int},
+    "days": {"id": int, "code": str},
+    "daysXtimeslots": {"id": int, "day": str, "timeslot": str},
+}
+
+
+# =================================================
+#   Validation
+# =================================================
+
+def check(condition, message):
+    if not condition:
+        raise Exception("Invalid instance: %s" % message)
+
+
+def validate(data):
+    for key in list(schema) + ["timeslots", "areasMatrix"]:
+        check(isinstance(data.get(key), list), "%s is missing or not a list" % key)
+
+    ids = {}
+    for key, fields in schema.items():
+        ids[key] = set()
+        for k, record in enumerate(data[key]):
+            check(isinstance(record, dict), "%s[%d] is not an object" % (key, k))
+            for field, kind in fields.items():
+                check(field in record, "%s[%d] has no %s" % (key, k, field))
+                if kind is int:
+                    check(not isinstance(record[field], bool) and str(record[field]).strip().lstrip("-").isdigit(),
+                          "%s[%d].%s is not an integer (%r)" % (key, k, field, record[field]))
+                    record[field] = int(record[field])
+                else:
+                    check(isinstance(record[field], kind), "%s[%d].%s is not a %s" % (key, k, field, kind.__name__))
+            check(record["id"] not in ids[key], "duplicate %s id %d" % (key, record["id"]))
+            ids[key].add(record["id"])
+
+    codes = set(i["code"] for i in data["days"])
+    for s in data["streams"]:
+        check(s["areaId"] in ids["areas"], "stream %d has an unknown area %d" % (s["id"], s["areaId"]))
+        check(s["sessions"] >= 1 and s["att"] >= 1, "stream %d needs at least one session and one attendant" % s["id"])
+    for r in data["rooms"]:
+        check(r["buildingId"] in ids["buildings"], "room %d has an unknown building %d" % (r["id"], r["buildingId"]))
+        check(r["max"] >= 1, "room %d has no capacity" % r["id"])
+    for x in data["daysXtimeslots"]:
+        check(x["day"] in codes and x["timeslot"] in data["timeslots"], "slot %d has an unknown day or timeslot (%s, %s)" % (x["id"], x["day"], x["timeslot"]))
+    check(len(set((x["day"], x["timeslot"]) for x in data["daysXtimeslots"])) == len(data["daysXtimeslots"]), "duplicate (day, timeslot) in daysXtimeslots")
+    for pair in data["areasMatrix"]:
+        check(isinstance(pair, list) and len(pair) == 2 and all(a in ids["areas"] for a in pair), "areasMatrix pair %r is not a pair of areas" % (pair,))
+
+    return data
+
+
+def load(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return validate(data)
+
+
+# =================================================
+#   Indexes
+# =================================================
+
+def indexes(data):
+    out = {
+        "areas": {i["id"]: i for i in data["areas"]},
+        "streams": {i["id"]: i for i in data["streams"]},
+        "buildings": {i["id"]: i for i in data["buildings"]},
+        "rooms": {i["id"]: i for i in data["rooms"]},
+        "streamsByArea": {i["id"]: [] for i in data["areas"]},
+        "roomsByBuilding": {i["id"]: [] for i in data["buildings"]},
+        "slots": {(x["day"], x["timeslot"]): x["id"] for x in data["daysXtimeslots"]},
+        "dxt": [(x["day"], x["timeslot"]) for x in sorted(data["daysXtimeslots"], key=lambda x: x["id"])],
+    }
+    for s in data["streams"]:
+        out["streamsByArea"][s["areaId"]].append(s)
+    for r in data["rooms"]:
+        out["roomsByBuilding"][r["buildingId"]].append(r)
+    return out
@@ -0,0 +1,102 @@
+import logging, builder, cache, metrics, pipeline, solver, budget
+import pyomo.environ as pyo
+from datetime import datetime
+
+# Stages 3 to 5 of a building as one lexicographic optimization: the model is built once with the
+# structure of mip5 (U, FIRST/LAST and their constraints) and without the bounds on the upstream
+# objectives, then each stage swaps in its objective, is solved, and turns its objective value into
+# a bound row (const14 on the rooms after mip3, const13 on the gaps after mip4, as in mip5). With a
+# persistent backend (highs, cplex_persistent) the solver keeps the model loaded and only gets the
+# new row and objective; every solve starts from the incumbent of the previous one, which stays
+# feasible under the new bound. The stage results, cache entries and metrics are the ones of
+# pipeline.runBuilding, the cache is only used when it holds the three stages.
+
+stages = [3, 4, 5]
+
+
+# =================================================
+#   Objectives and bounds
+# =================================================
+
+def setObjective(model, stage):
+    if hasattr(model, "objective"):
+        model.del_component(model.objective)
+    rule, sense = builder.objectives[stage]
+    model.objective = pyo.Objective(rule=rule, sense=sense)
+    return model.objective
+
+
+def addBound(model, stage, master):
+    # Bound row on the objective of the solved stage, named as in the mip5 model
+    if stage == 3:
+        model.const14 = pyo.Constraint(expr=builder.roomsObjective(model) <= round(master["objective"]["value"]))
+        return [model.const14]
+    if stage == 4:
+        model.const13 = pyo.Constraint(expr=builder.gapsObjective(model) <= round(master["objective"]["value"]))
+        return [model.const13]
+    return []
+
+
+# =================================================
+#   Chain
+# =================================================
+
+def cachedChain(data, warmup, building, settings):
+    # The three stage results when the cache holds all of them
+    masters = []
+    for stage in stages:
+        key = cache.stageKey(data, stage, settings, warmup=warmup if stage == 3 else masters[-1], mip3=masters[0] if stage == 5 else None)
+        cached = cache.load(settings, key)
+        if cached is None:
+            return None
+        masters.append(cached["mip_%d_%d" % (stage, building)])
+    return masters
+
+
+def runChain(data, warmup, wd, threads, checkpoint=True, settings=None):
+    settings = budget.start({} if settings is None else settings, 3)
+    building = int(warmup["buildingId"])
+
+    cached = cachedChain(data, warmup, building, settings)
+    if cached is not None:
+        for stage, master in zip(stages, cached):
+            run = metrics.begin(settings, stage, building)
+            pipeline.writeResults(wd, {"mip_%d_%d" % (stage, building): master}, checkpoint, settings=settings)
+            metrics.finish(run, wd, cached=True)
+        return tuple(cached)
+
+    logging.info("[%s] start mip3-5 (b=%d, one model)" % (datetime.now(), building))
+
+    run = metrics.begin(settings, 3, building)
+    model = builder.buildModel(builder.warmupData(data, warmup), 5, options=settings, timings=metrics.timings(run), bounds=False)
+    setObjective(model, 3)
+    metrics.lap(run)
+    pipeline.warmupModel(model, 3, warmup, settings)
+    metrics.lap(run, "warmstart")
+
+    session = {}
+    masters = []
+    for stage in stages:
+        if stage > 3:
+            run = metrics.begin(settings, stage, building)
+            rows = addBound(model, stage - 1, masters[-1])
+            solver.update(session.get("backend"), session.get("opt"), constraints=rows, objective=setObjective(model, stage))
+            metrics.lap(run)
+
+        logging.info("[%s] start mip%d (b=%d)" % (datetime.now(), stage, building))
+        upstream = warmup if stage == 3 else masters[-1]
+        results = pipeline.solveModel(model, stage, wd, threads, building=building, settings=settings, warm=True, run=run, session=session)
+        solved = pipeline.incumbent(model, results, upstream)
+
+        name = "mip_%d_%d" % (stage, building)
+        master = pipeline.exportBuilding(model, stage, building)
+        if solved and cache.complete(stage, model, results):
+            cache.store(settings, cache.stageKey(data, stage, settings, warmup=upstream, mip3=masters[0] if stage == 5 else None), stage, {name: master})
+        pipeline.writeResults(wd, {name: master}, checkpoint, settings=settings)
+        metrics.lap(run, "export")
+        metrics.finish(run, wd)
+        masters.append(master)
+
+        logging.info("[%s] stop mip%d (b=%d)" % (datetime.now(), stage, building))
+
+    return tuple(masters)
@@ -0,0 +1,119 @@
+import os, json, time, resource, solver
+import pyomo.environ as pyo
+
+# Per-stage metrics, one JSON line per stage run (per building for stages 3 to 5) appended to
+# <wd>/metrics.jsonl: the time of each phase (instance and upstream loading, sets/parameters/
+# variables, constraints, warm start, solver I/O, solve, export), the model size, the incumbent,
+# best bound and gap, and the peak RSS of the process (the whole process so far: in-process runs
+# report the peak of the run up to that stage). Everything is a no-op unless settings["metrics"]
+# is set. summary() aggregates the file per stage for the runner.
+
+phases = ["load", "heuristic", "sets", "constraints", "warmstart", "io", "solve", "export"]
+
+# Time spent loading the instance and the upstream results by the script, charged to the next stage
+loading = {"time": 0.0}
+
+
+# =================================================
+#   Recording
+# =================================================
+
+def loaded(seconds):
+    loading["time"] += seconds
+
+
+def begin(settings, stage, building=None):
+    if settings is None or not settings.get("metrics", False):
+        return None
+    now = time.perf_counter()
+    run = {"stage": stage, "building": building, "timings": {"load": loading["time"]}, "start": now, "last": now}
+    loading["time"] = 0.0
+    return run
+
+
+def lap(run, name=None):
+    # Time since the previous lap charged to the phase name (None: not charged)
+    if run is None:
+        return
+    now = time.perf_counter()
+    if name is not None:
+        run["timings"][name] = run["timings"].get(name, 0.0) + now - run["last"]
+    run["last"] = now
+
+
+def timings(run):
+    # Dict the model builders fill with the time of their sets and constraints
+    return None if run is None else run["timings"]
+
+
+def solved(run, model, results, timing):
+    if run is None:
+        return
+    sense = model.objective.sense
+    run["timings"]["io"] = run["timings"].get("io", 0.0) + timing["write"]
+    run["timings"]["solve"] = run["timings"].get("solve", 0.0) + timing["solve"]
+    run["variables"] = sum(1 for _ in model.component_data_objects(pyo.Var))
+    run["constraints"] = sum(1 for _ in model.component_data_objects(pyo.Constraint, active=True))
+    run["termination"] = str(results.solver.termination_condition)
+    run["incumbent"] = pyo.value(model.objective) if solver.hasSolution(results, sense) else None
+    run["bound"] = solver.bestBound(results, sense)
+    run["gap"] = solver.relativeGap(run["incumbent"], run["bound"])
+    run["solves"] = run.get("solves", 0) + 1
+    lap(run)
+
+
+def finish(run, wd, cached=False):
+    if run is None:
+        return
+    record = {key: run[key] for key in run if key not in ["start", "last"]}
+    record["total"] = time.perf_counter() - run["start"]
+    record["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    record["cached"] = cached
+    record["pid"] = os.getpid()
+
+    # one write per line on a file opened in append mode: lines of concurrent buildings do not mix
+    os.makedirs(wd, exist_ok=True)
+    fd = os.open(os.path.join(wd, "metrics.jsonl"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    os.write(fd, (json.dumps(record) + "\n").encode())
+    os.close(fd)
+
+
+# =================================================
+#   Summary
+# =================================================
+
+def summary(wd):
+    path = os.path.join(wd, "metrics.jsonl")
+    if not os.path.exists(path):
+        return None
+
+    out = {}
+    f = open(path, "r")
+    for line in f:
+        record = json.loads(line)
+        stage = out.setdefault(str(record["stage"]), {"runs": 0, "cached": 0, "total": 0.0, "rss": 0.0, "variables": 0, "constraints": 0,
+                                                      "timings": {name: 0.0 for name in phases}, "worstGap": None})
+        stage["runs"] += 1
+        stage["cached"] += 1 if record["cached"] else 0
+        stage["total"] += record["total"]
+        stage["rss"] = max(stage["rss"], record["rss"])
+        stage["variables"] = max(stage["variables"], record.get("variables", 0))
+        stage["constraints"] = max(stage["constraints"], record.get("constraints", 0))
+        for name in record["timings"]:
+            stage["timings"][name] = stage["timings"].get(name, 0.0) + record["timings"][name]
+        if record.get("gap") is not None:
+            stage["worstGap"] = max(stage["worstGap"] or 0.0, record["gap"])
+    f.close()
+
+    with open(os.path.join(wd, "metrics_summary.json"), "w") as outfile:
+        json.dump(out, outfile)
+    return out
+
+
+def printSummary(out):
+    # Times are summed over the buildings of a stage (solved concurrently or not)
+    print("%-6s %5s %7s %10s" % ("stage", "runs", "cached", "total (s)") + "".join(" %10s" % name for name in phases) + " %10s %10s %12s %8s" % ("RSS (MB)", "variables", "constraints", "gap"))
+    for stage in sorted(out):
+        s = out[stage]
+        print("%-6s %5d %7d %10.3f" % (stage, s["runs"], s["cached"], s["total"]) + "".join(" %10.3f" % s["timings"].get(name, 0.0) for name in phases)
+              + " %10.1f %10d %12d %8s" % (s["rss"], s["variables"], s["constraints"], "-" if s["worstGap"] is None else "%.1f%%" % (100 * s["worstGap"])))
@@ -0,0 +1,449 @@
+import os, sys, time, pathlib, logging, argparse, multiprocessing, budget, builder, cache, metrics, progress, solver, solution, warmstart
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pyomo.environ as pyo
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "heuristic"))
+import heuristic, localsearch
+
+
+# =================================================
+#   Solve
+# =================================================
+
+def solveModel(model, stage, wd, threads, building=None, settings=None, warm=None, run=None, session=None):
+    # session: dict kept by the caller across the solves of one model (lexico.py), the solver of
+    # the first solve is reused by the next ones (re-solved in place by the persistent backends)
+    settings = {} if settings is None else settings
+    name = "obj_%d" % stage if building is None else "obj_%d_%d" % (stage, building)
+    backend = solver.stageBackend(settings.get("solver", "cplex"), stage)
+    progress.check(settings, backend)
+    timelimit, mipgap = budget.limits(settings, stage)
+
+    logging.info("[%s] solve with %s" % (datetime.now(), backend))
+    if settings.get("deadline"):
+        logging.info("[%s] budget: %.0fs left, time limit %.0fs, gap %s" % (datetime.now(), settings["deadline"] - time.time(), timelimit, mipgap))
+
+    loaded = session is not None and session.get("backend") == backend
+    if loaded:
+        opt = session["opt"]
+        solver.setLimits(backend, opt, timelimit=timelimit, mipgap=mipgap)
+    else:
+        opt = solver.getSolver(backend, threads, timelimit=timelimit, mipgap=mipgap)
+        if session is not None:
+            session.update({"backend": backend, "opt": opt})
+    track = progress.tracker(settings, stage, building)
+    results, timing = solver.solve(backend, opt, model, "%s.log" % name, warmstart=stage > 1 if warm is None else warm, keepfiles=settings.get("keepfiles", False), track=track,
+                                   loaded=loaded)
+    progress.finish(track, wd, name)
+
+    logging.info("[%s] model writing/reading %.3fs, solver %.3fs" % (datetime.now(), timing["write"], timing["solve"]))
+    logging.info("[%s] save result to %s/cplex/%s.log" % (datetime.now(), wd, name))
+
+    os.makedirs('%s/cplex' % wd, exist_ok=True)
+    f = open('%s/cplex/%s.log' % (wd, name), "w")
+    f.write(str(results))
+    f.write("# model writing/reading: %.3f s\n# solver: %.3f s\n" % (timing["write"], timing["solve"]))
+    f.close()
+
+    metrics.solved(run, model, results, timing)
+
+    return results
+
+
+# =================================================
+#   Warm start
+# =================================================
+
+def warmupModel(model, stage, warmup, settings=None):
+    # CPLEX completes a partial MIP start itself, the other backends get every binary set
+    backend = solver.stageBackend(({} if settings is None else settings).get("solver", "cplex"), stage)
+    warmstart.apply(model, warmup, complete=not backend.startswith("cplex"))
+
+
+def incumbent(model, results, warmup):
+    # Without an incumbent the model still holds the warm start (partial for CPLEX): the upstream
+    # schedule is restored in full and kept as the stage result, which is not cached
+    if solver.hasSolution(results, model.objective.sense):
+        return True
+    logging.warning("[%s] no incumbent from the solver (%s), keep the upstream schedule" % (datetime.now(), results.solver.termination_condition))
+    warmstart.apply(model, warmup, complete=True)
+    return False
+
+
+# =================================================
+#   Export
+# =================================================
+
+def state(var, i):
+    return {"tuple": i, "state": round(pyo.value(var[i]))}
+
+
+def disaggregated(data, model):
+    # X records of an aggregated stage 1/2 model, rebuilt from its building assignment
+    assigned = [i for i in model.Y if round(pyo.value(model.Y[i])) == 1]
+    return [{"tuple": i, "state": 1} for i in builder.disaggregate(data, assigned)]
+
+
+def exportGlobal(model, x=None):
+    return {"objective": {"value": pyo.value(model.objective)},
+            "X": [state(model.X, i) for i in model.X] if x is None else x,
+            "Y": [state(model.Y, i) for i in model.Y],
+            "Q": [state(model.Q, i) for i in model.Q]}
+
+
+def exportBuildings(model, x=None):
+    master = {}
+
+    for i in model.B:
+        master[i] = {"buildingId": int(i), "objective": {"value": round(pyo.value(model.objective))},
+                     "X": [], "Y": [], "Q": [], "areas": [], "streams": []}
+
+    logging.info("[%s] model Y" % datetime.now())
+
+    for i in model.Y:
+        areaId = int(i[0])
+        streamId = int(i[1])
+        buildingId = int(i[2])
+        if areaId not in master[buildingId]["areas"] and round(pyo.value(model.Y[i])) == 1:
+            master[buildingId]["areas"].append(areaId)
+        if streamId not in master[buildingId]["streams"] and round(pyo.value(model.Y[i])) == 1:
+            master[buildingId]["streams"].append(streamId)
+        if areaId in master[buildingId]["areas"]:
+            master[buildingId]["Y"].append(state(model.Y, i))
+
+    logging.info("[%s] model Q" % datetime.now())
+
+    for i in model.Q:
+        areaId = int(i[0])
+        buildingId = int(i[1])
+        if areaId in master[buildingId]["areas"]:
+            master[buildingId]["Q"].append(state(model.Q, i))
+
+    logging.info("[%s] model X" % datetime.now())
+
+    for record in ([state(model.X, i) for i in model.X] if x is None else x):
+        areaId = int(record["tuple"][0])
+        streamId = int(record["tuple"][1])
+        buildingId = int(record["tuple"][2])
+        if areaId in master[buildingId]["areas"] and streamId in master[buildingId]["streams"]:
+            master[buildingId]["X"].append(record)
+
+    return {int(i): master[i] for i in model.B if len(master[i]["streams"]) > 0}
+
+
+def exportBuilding(model, stage, building):
+    variables = ["X", "Y", "Q", "U"] + (["FIRST", "LAST"] if stage >= 4 else [])
+
+    master = {"buildingId": building, "objective": {"value": round(pyo.value(model.objective))}, "areas": [], "streams": []}
+
+    for i in model.Y:
+        if round(pyo.value(model.Y[i])) == 1:
+            if int(i[0]) not in master["areas"]:
+                master["areas"].append(int(i[0]))
+            if int(i[1]) not in master["streams"]:
+                master["streams"].append(int(i[1]))
+
+    for name in variables:
+        logging.info("[%s] model %s" % (datetime.now(), name))
+        var = getattr(model, name)
+        master[name] = [state(var, i) for i in var]
+
+    return master
+
+
+def writeResult(wd, name, result, settings=None):
+    fmt = "npy" if settings is None else settings.get("format", "npy")
+
+    logging.info("[%s] export result to %s/%s (%s)" % (datetime.now(), wd, name, fmt))
+
+    solution.writeResult(wd, name, result, fmt=fmt)
+
+
+def writeResults(wd, results, checkpoint, settings=None):
+    if checkpoint:
+        for name in results:
+            writeResult(wd, name, results[name], settings=settings)
+
+
+def buildingResults(results):
+    # {building: result} of the mip_<stage>_<building> results
+    return {int(name.split("_")[2]): results[name] for name in results if name.count("_") == 2}
+
+
+# =================================================
+#   Stages
+# =================================================
+
+def runMip1(data, wd, threads, checkpoint=True, settings=None):
+    logging.info("[%s] start mip1" % datetime.now())
+
+    settings = budget.start({} if settings is None else settings)
+    run = metrics.begin(settings, 1)
+
+    key = cache.stageKey(data, 1, settings)
+    cached = cache.load(settings, key)
+    if cached is not None:
+        writeResults(wd, cached, checkpoint, settings=settings)
+        metrics.finish(run, wd, cached=True)
+        return cached["mip_1"], buildingResults(cached)
+
+    # Greedy schedule (heuristic/heuristic.py), improved by tabu search when iterations are given
+    # (heuristic/localsearch.py), used as the initial incumbent and as the result when the solver
+    # stops without one
+    start = None
+    if settings.get("localsearch", 0) > 0:
+        start = localsearch.assignment(localsearch.search(data, iterations=settings["localsearch"]))
+        logging.info("[%s] local search start: objectives %s" % (datetime.now(), start["objectives"]))
+    elif settings.get("heuristic", False):
+        start = heuristic.assignment(data)
+        logging.info("[%s] heuristic start: objective %s" % (datetime.now(), start["objective"]["value"]))
+    metrics.lap(run, "heuristic")
+
+    aggregate = settings.get("aggregate", False)
+    if aggregate:
+        model = builder.buildAggregatedModel(data, 1, options=settings, timings=metrics.timings(run))
+    else:
+        model = builder.buildModel(data, 1, options=settings, timings=metrics.timings(run))
+    metrics.lap(run)
+    if start is not None:
+        warmupModel(model, 1, start, settings)
+    metrics.lap(run, "warmstart")
+    results = solveModel(model, 1, wd, threads, settings=settings, warm=start is not None, run=run)
+
+    # the heuristic fallback and the incumbents cut short are not cached
+    solved = solver.hasSolution(results, pyo.minimize)
+    complete = solved and cache.complete(1, model, results)
+    if not solved:
+        logging.warning("[%s] no incumbent from the solver (%s), fall back to the heuristic schedule" % (datetime.now(), results.solver.termination_condition))
+        start = heuristic.assignment(data) if start is None else start
+        warmstart.apply(model, start, complete=True)
+
+    logging.info("[%s] export result" % datetime.now())
+
+    x = disaggregated(data, model) if aggregate else None
+    out = exportGlobal(model, x=x)
+    masters = exportBuildings(model, x=x)
+
+    results = {"mip_1": out}
+    results.update({"mip_1_%d" % building: masters[building] for building in masters})
+    if complete:
+        cache.store(settings, key, 1, results)
+    writeResults(wd, results, checkpoint, settings=settings)
+    metrics.lap(run, "export")
+    metrics.finish(run, wd)
+
+    logging.info("[%s] stop mip1" % datetime.now())
+
+    return out, masters
+
+
+def runMip2(data, warmup, wd, threads, checkpoint=True, settings=None):
+    logging.info("[%s] start mip2" % datetime.now())
+
+    settings = budget.start({} if settings is None else settings, 2)
+    run = metrics.begin(settings, 2)
+
+    key = cache.stageKey(data, 2, settings, warmup=warmup)
+    cached = cache.load(settings, key)
+    if cached is not None:
+        writeResults(wd, cached, checkpoint, settings=settings)
+        metrics.finish(run, wd, cached=True)
+        return buildingResults(cached)
+
+    aggregate = settings.get("aggregate", False)
+    if aggregate:
+        model = builder.buildAggregatedModel(data, 2, warmup=warmup, options=settings, timings=metrics.timings(run))
+    else:
+        model = builder.buildModel(data, 2, warmup=warmup, options=settings, timings=metrics.timings(run))
+    metrics.lap(run)
+    warmupModel(model, 2, warmup, settings)
+    metrics.lap(run, "warmstart")
+    results = solveModel(model, 2, wd, threads, settings=settings, run=run)
+    solved = incumbent(model, results, warmup) and cache.complete(2, model, results)
+
+    logging.info("[%s] export result" % datetime.now())
+
+    masters = exportBuildings(model, x=disaggregated(data, model) if aggregate else None)
+
+    results = {"mip_2_%d" % building: masters[building] for building in masters}
+    if solved:
+        cache.store(settings, key, 2, results)
+    writeResults(wd, results, checkpoint, settings=settings)
+    metrics.lap(run, "export")
+    metrics.finish(run, wd)
+
+    logging.info("[%s] stop mip2" % datetime.now())
+
+    return masters
+
+
+def runBuilding(data, stage, warmup, wd, threads, mip3=None, checkpoint=True, settings=None):
+    building = int(warmup["buildingId"])
+
+    logging.info("[%s] start mip%d (b=%d)" % (datetime.now(), stage, building))
+
+    settings = budget.start({} if settings is None else settings, stage)
+    name = "mip_%d_%d" % (stage, building)
+    run = metrics.begin(settings, stage, building)
+
+    key = cache.stageKey(data, stage, settings, warmup=warmup, mip3=mip3)
+    cached = cache.load(settings, key)
+    if cached is not None:
+        writeResults(wd, cached, checkpoint, settings=settings)
+        metrics.finish(run, wd, cached=True)
+        return cached[name]
+
+    model = builder.buildModel(builder.warmupData(data, warmup), stage, warmup=warmup, mip3=mip3, options=settings, timings=metrics.timings(run))
+    metrics.lap(run)
+    warmupModel(model, stage, warmup, settings)
+    metrics.lap(run, "warmstart")
+    results = solveModel(model, stage, wd, threads, building=building, settings=settings, run=run)
+    solved = incumbent(model, results, warmup)
+
+    logging.info("[%s] export result" % datetime.now())
+
+    master = exportBuilding(model, stage, building)
+
+    if solved and cache.complete(stage, model, results):
+        cache.store(settings, key, stage, {name: master})
+    writeResults(wd, {name: master}, checkpoint, settings=settings)
+    metrics.lap(run, "export")
+    metrics.finish(run, wd)
+
+    logging.info("[%s] stop mip%d (b=%d)" % (datetime.now(), stage, building))
+
+    return master
+
+
+# =================================================
+#   Pipeline
+# =================================================
+
+def runChain(data, warmup, wd, threads, checkpoint=True, settings=None):
+    if settings is not None and settings.get("lexico", False):
+        # imported here: lexico builds on the stage functions of this module
+        import lexico
+        return lexico.runChain(data, warmup, wd, threads, checkpoint=checkpoint, settings=settings)
+
+    mip3 = runBuilding(data, 3, warmup, wd, threads, checkpoint=checkpoint, settings=settings)
+    mip4 = runBuilding(data, 4, mip3, wd, threads, checkpoint=checkpoint, settings=settings)
+    mip5 = runBuilding(data, 5, mip4, wd, threads, mip3=mip3, checkpoint=checkpoint, settings=settings)
+    return mip3, mip4, mip5
+
+
+def runChains(data, masters, wd, threads, workers=1, checkpoint=True, settings=None):
+    # Buildings are independent after mip2: each one runs mip3 -> mip4 -> mip5 in its own worker
+    # and the thread budget is split between the concurrent solves. The largest buildings are
+    # submitted first so that they do not end up alone at the tail of the schedule. The workers are
+    # spawned, not forked: HiGHS has started its thread pool in this process for mip1 and mip2 and
+    # a forked copy of it ignores the thread option and can fail the solve. With a budget
+    # each chain gets its share of the time left by size (budget.chain).
+    workers = max(1, min(workers, len(masters), threads))
+    order = sorted(masters, key=lambda b: len(masters[b]["streams"]), reverse=True)
+    sizes = {b: budget.buildingSize(data, masters[b]) for b in order}
+
+    if workers == 1:
+        chains = {}
+        for k, b in enumerate(order):
+            chains[b] = runChain(data, masters[b], wd, threads, checkpoint=checkpoint, settings=budget.chain(settings, sizes[b], sum(sizes[c] for c in order[k:])))
+    else:
+        logging.info("[%s] run %d buildings on %d workers (%d threads each)" % (datetime.now(), len(masters), workers, threads // workers))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # a chain is submitted when a worker is free, so that its share of the budget is taken
+            # when it starts and not while it waits in the queue
+            futures = {}
+            running = set()
+            for k, b in enumerate(order):
+                if len(running) == workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                futures[b] = pool.submit(runChain, data, masters[b], wd, threads // workers, checkpoint, budget.chain(settings, sizes[b], sum(sizes[c] for c in order[k:]), workers=workers))
+                running.add(futures[b])
+            chains = {b: futures[b].result() for b in order}
+
+    return [{b: chains[b][k] for b in masters} for k in range(3)]
+
+
+def showResults(visualize, data, masters):
+    if visualize is None:
+        return
+    for building in masters:
+        visualize(data, masters[building])
+
+
+def runPipeline(data, wd, threads, checkpoint=False, visualize=None, workers=1, settings=None):
+    settings = budget.start(settings)
+    out, masters = runMip1(data, wd, threads, checkpoint=checkpoint, settings=settings)
+    showResults(visualize, data, masters)
+
+    masters = runMip2(data, out, wd, threads, checkpoint=checkpoint, settings=settings)
+    showResults(visualize, data, masters)
+
+    mip3, mip4, mip5 = runChains(data, masters, wd, threads, workers=workers, checkpoint=checkpoint, settings=settings)
+    showResults(visualize, data, mip3)
+    showResults(visualize, data, mip4)
+    showResults(visualize, data, mip5)
+
+    return mip5
+
+
+# =================================================
+#   Stage scripts
+# =================================================
+
+def stageArguments(stage):
+    # Command line of mip<stage>.py: the options of the stage, with the solver backends checked
+    # before anything is loaded
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-rd", "--rd", help='raw data', default="%s\\..\\data\\light.json" % pathlib.Path().resolve(), type=str)
+    parser.add_argument("-wd", "--wd", help='working directory', default="%s\\output" % pathlib.Path().resolve(), type=str)
+    if stage >= 3:
+        parser.add_argument("-b", "--b", help='building id', default=2, type=int)
+    parser.add_argument("-mt", "--mt", help='maximum thread', default=4, type=int)
+    parser.add_argument("-sv", "--sv", help='solver backend (%s), or one backend per stage separated by commas' % ", ".join(solver.backends), default="cplex", type=str)
+    parser.add_argument("-kf", "--kf", help='keep the solver LP/solution files (debug)', action='store_true')
+    if stage == 1:
+        parser.add_argument("-hs", "--hs", help='warm start from the greedy heuristic schedule', action='store_true')
+        parser.add_argument("-ls", "--ls", help='tabu search iterations on the heuristic schedule before the warm start (0: off)', default=0, type=int)
+    parser.add_argument("-fm", "--fm", help='result format (npy, json or both)', default="npy", type=str)
+    parser.add_argument("-ca", "--ca", help='stage result cache directory (none: no cache)', default=None, type=str)
+    parser.add_argument("-cs", "--cs", help='stage result cache size limit (MB)', default=1024, type=int)
+    parser.add_argument("-mx", "--mx", help='append the stage metrics to <wd>/metrics.jsonl', action='store_true')
+    parser.add_argument("-pg", "--pg", help='record the incumbent/bound trajectory of the solve (<wd>/cplex/*.progress.json)', action='store_true')
+    parser.add_argument("-st", "--st", help='stop the solve when the gap has not improved for that many seconds (0: never)', default=0, type=float)
+    parser.add_argument("-bg", "--bg", help='time budget (seconds) of this stage and the next ones, shared by their solves (0: stage time limits)', default=0, type=float)
+    parser.add_argument("-fo", "--fo", help='model formulation (default or tight)', default="default", type=str)
+    parser.add_argument("-sy", "--sy", help='break the symmetry between interchangeable rooms', action='store_true')
+    if stage <= 2:
+        parser.add_argument("-ag", "--ag", help='aggregated model (building assignment and room capacity classes, X rebuilt afterwards)', action='store_true')
+        parser.add_argument("-dc", "--dc", dest="ag", help='same as -ag (the decomposition was dropped: the capacity rows of the aggregated model are exact)', action='store_true')
+    else:
+        parser.add_argument("-fx", "--fx", help='take the building assignment of mip2 as data (no Y/Q/V variables nor linking constraints)', action='store_true')
+    if stage == 3:
+        parser.add_argument("-lx", "--lx", help='solve mip3, mip4 and mip5 on one model (lexicographic objectives)', action='store_true')
+        parser.add_argument("-gp", "--gp", help='FIRST/LAST formulation of mip4/mip5 with -lx (bigm or time)', default="bigm", type=str)
+    elif stage >= 4:
+        parser.add_argument("-gp", "--gp", help='FIRST/LAST formulation (bigm or time)', default="bigm", type=str)
+    args = parser.parse_args()
+
+    try:
+        progress.check({"stall": args.st}, solver.stageBackend(args.sv, stage))
+    except Exception as e:
+        parser.error(str(e))
+    return args
+
+
+def stageSettings(args, stage):
+    # Settings of the stage functions from the arguments of stageArguments
+    settings = {"solver": args.sv, "keepfiles": args.kf, "format": args.fm, "cache": args.ca, "cachesize": args.cs, "metrics": args.mx, "progress": args.pg, "stall": args.st,
+                "budget": args.bg, "formulation": args.fo, "symmetry": args.sy}
+    if stage == 1:
+        settings.update({"heuristic": args.hs, "localsearch": args.ls})
+    if stage <= 2:
+        settings["aggregate"] = args.ag
+    else:
+        settings["fixed"] = args.fx
+    if stage >= 4:
+        settings["gaps"] = args.gp
+    return settings
@@ -0,0 +1,117 @@
+import os, json, math, logging
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+from datetime import datetime
+
+# Progress of a MIP solve: the (time, incumbent, best bound, gap) points reported by the solver
+# while it runs, and an early stop once the gap has not improved by more than the tolerance during
+# the stall window (seconds) with an incumbent at hand (gap relative to the incumbent, at least 1,
+# so that incumbents close to 0 do not blow it up). The points come from the solver callbacks
+# of the backends that run in this process: the MIP interrupt callback of HiGHS and the MIP info
+# callback of CPLEX (cplex_persistent, whose model exists before the solve). The shell interfaces
+# run the solver in another process and cplex_direct builds its model inside the solve call: they
+# are not tracked, and a stall window is rejected with them rather than ignored. The trajectory is
+# written next to the solver log (<wd>/cplex/obj_<stage>[_<building>].progress.json).
+
+tolerance = 1e-3
+tracked = ["highs", "cplex_persistent"]
+
+
+# =================================================
+#   Tracking
+# =================================================
+
+def check(settings, backend):
+    if settings.get("stall") and backend not in tracked:
+        raise Exception("No stall detection with the %s backend (%s only)" % (backend, " or ".join(tracked)))
+
+
+def tracker(settings, stage, building=None):
+    settings = {} if settings is None else settings
+    if not settings.get("progress", False) and not settings.get("stall"):
+        return None
+    return {"stage": stage, "building": building, "window": settings.get("stall") or None, "points": [],
+            "best": math.inf, "improved": 0.0, "stopped": False}
+
+
+def record(track, elapsed, incumbent, bound):
+    # Returns True when the solve should stop (gap stalled over the window)
+    incumbent = incumbent if incumbent is not None and math.isfinite(incumbent) else None
+    bound = bound if bound is not None and math.isfinite(bound) else None
+    gap = None if incumbent is None or bound is None else abs(incumbent - bound) / max(abs(incumbent), 1.0)
+
+    if len(track["points"]) == 0 or track["points"][-1][1:3] != [incumbent, bound]:
+        track["points"].append([elapsed, incumbent, bound, gap])
+
+    if gap is None:
+        return False
+    if gap < track["best"] - tolerance:
+        track["best"] = gap
+        track["improved"] = elapsed
+    if track["window"] is not None and not track["stopped"] and elapsed - track["improved"] >= track["window"]:
+        logging.info("[%s] gap %.2f%% stalled for %.0fs, stop the solve" % (datetime.now(), 100 * gap, elapsed - track["improved"]))
+        track["stopped"] = True
+    return track["stopped"]
+
+
+def stopped(track, results, sense):
+    # A stopped solve keeps its incumbent, which the interfaces do not always report (appsi HiGHS
+    # leaves the status of an interrupted solve unknown): report it as a user interrupt with the
+    # last incumbent as its objective bound, so that solver.hasSolution loads it
+    if track is None or not track["stopped"]:
+        return
+    incumbent = [point[1] for point in track["points"] if point[1] is not None][-1]
+    results.solver.termination_condition = TerminationCondition.userInterrupt
+    if sense == pyo.minimize:
+        results.problem.upper_bound = incumbent
+    else:
+        results.problem.lower_bound = incumbent
+
+
+def finish(track, wd, name):
+    if track is None:
+        return
+    os.makedirs("%s/cplex" % wd, exist_ok=True)
+    with open("%s/cplex/%s.progress.json" % (wd, name), "w") as outfile:
+        json.dump({"stage": track["stage"], "building": track["building"], "stopped": track["stopped"],
+                   "points": [dict(zip(["time", "incumbent", "bound", "gap"], point)) for point in track["points"]]}, outfile)
+
+
+# =================================================
+#   Solver callbacks
+# =================================================
+
+def attachHighs(highs, track):
+    def interrupt(event):
+        out = event.data_out
+        # written at every call: HiGHS keeps the flag of an interrupted solve for the next one
+        event.interrupt(record(track, out.running_time, out.mip_primal_bound, out.mip_dual_bound))
+    # a model re-solved in the same HiGHS instance (lexico.py) drops the tracker of its last solve
+    highs.cbMipInterrupt.clear()
+    highs.cbMipInterrupt.subscribe(interrupt)
+
+
+def attachCplex(cpx, track):
+    import cplex.callbacks
+
+    class Info(cplex.callbacks.MIPInfoCallback):
+        def __call__(self):
+            incumbent = self.get_incumbent_objective_value() if self.has_incumbent() else None
+            if record(track, self.get_time() - self.get_start_time(), incumbent, self.get_best_objective_value()):
+                self.abort()
+
+    cpx.register_callback(Info)
+
+
+def attach(name, opt, track):
+    # opt after set_instance (persistent interfaces); False when the backend cannot be tracked
+    if track is None:
+        return False
+    if name == "highs":
+        attachHighs(opt._solver_model, track)
+        return True
+    if name == "cplex_persistent":
+        attachCplex(opt._solver_model, track)
+        return True
+    logging.warning("[%s] no progress tracking with the %s backend (%s only)" % (datetime.now(), name, " or ".join(tracked)))
+    return False
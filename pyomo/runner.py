@@ -1,78 +1,145 @@
-import os, re, sys, pathlib, socket, logging
+import os, re, time, pathlib, socket, logging, argparse
+from concurrent.futures import ThreadPoolExecutor
 
 logging.getLogger().setLevel(logging.INFO)
 
 vpy = "python3" if socket.gethostname() != "DESKTOP-H4LHSCT" else "python"
 
+parser = argparse.ArgumentParser()
+
+parser.add_argument("mt", help='maximum thread', nargs='?', default=4, type=int)
+parser.add_argument("spath", help='scripts directory', nargs='?', default=pathlib.Path().resolve(), type=str)
+parser.add_argument("wpath", help='working directory', nargs='?', default="%s/output" % pathlib.Path().resolve(), type=str)
+parser.add_argument("wdata", help='raw data', nargs='?', default="%s/../data/light.json" % pathlib.Path().resolve(), type=str)
+parser.add_argument("-ip", "--inprocess", help='run every stage in this process', action='store_true')
+parser.add_argument("-ck", "--checkpoint", help='write the mip_*.json results in in-process mode', action='store_true')
+parser.add_argument("-pw", "--workers", help='buildings solved concurrently in stages 3 to 5', default=1, type=int)
+parser.add_argument("-sv", "--solver", help='solver backend, or one backend per stage separated by commas', default="cplex", type=str)
+parser.add_argument("-kf", "--keepfiles", help='keep the solver LP/solution files (debug)', action='store_true')
+parser.add_argument("-hs", "--heuristic", help='warm start mip1 from the greedy heuristic schedule', action='store_true')
+parser.add_argument("-ls", "--localsearch", help='tabu search iterations on the heuristic schedule before mip1 (0: off)', default=0, type=int)
+parser.add_argument("-fm", "--format", help='result format (npy, json or both)', default="npy", type=str)
+parser.add_argument("-fo", "--formulation", help='model formulation (default or tight)', default="default", type=str)
+parser.add_argument("-sy", "--symmetry", help='break the symmetry between interchangeable rooms', action='store_true')
+parser.add_argument("-ag", "--aggregate", help='aggregated mip1/mip2 models (X rebuilt for mip3)', action='store_true')
+parser.add_argument("-dc", "--decompose", dest="aggregate", help='same as -ag (the decomposition was dropped: the capacity rows of the aggregated model are exact)', action='store_true')
+parser.add_argument("-ca", "--cache", help='stage result cache directory (none: no cache)', default=None, type=str)
+parser.add_argument("-cs", "--cachesize", help='stage result cache size limit (MB)', default=1024, type=int)
+parser.add_argument("-mx", "--metrics", help='record the stage metrics (metrics.jsonl) and print their summary', action='store_true')
+parser.add_argument("-pg", "--progress", help='record the incumbent/bound trajectory of every solve (cplex/*.progress.json)', action='store_true')
+parser.add_argument("-st", "--stall", help='stop a solve when its gap has not improved for that many seconds (0: never)', default=0, type=float)
+parser.add_argument("-bg", "--budget", help='wall-clock budget of the run (seconds) handed out to the stages and buildings (0: stage time limits)', default=0, type=float)
+parser.add_argument("-fx", "--fixed", help='take the building assignment of mip2 as data in mip3 to mip5 (no Y/Q/V variables nor linking constraints)', action='store_true')
+parser.add_argument("-lx", "--lexico", help='solve mip3 to mip5 of a building on one model with swapped objectives', action='store_true')
+parser.add_argument("-gp", "--gaps", help='FIRST/LAST formulation of mip4/mip5 (bigm or time)', default="bigm", type=str)
+args = parser.parse_args()
+
+# checked before the first stage: the backend of every stage, and its solver callbacks for the
+# stall detection
+import solver, progress
 try:
-    maxThread = int(sys.argv[1])
-    spath = sys.argv[2]
-    wpath = sys.argv[3]
-    wdata = sys.argv[4]
-except:
-    maxThread = 4
-    spath = pathlib.Path().resolve()
-    wpath = "%s/output" % pathlib.Path().resolve()
-    wdata = "%s/../data/light.json" % pathlib.Path().resolve()
+    for stage in solver.limits:
+        progress.check(vars(args), solver.stageBackend(args.solver, stage))
+except Exception as e:
+    parser.error(str(e))
+
+maxThread = args.mt
+spath = args.spath
+wpath = args.wpath
+wdata = args.wdata
+sopts = "-sv %s -fm %s -fo %s%s%s%s%s%s%s" % (args.solver, args.format, args.formulation, " -kf" if args.keepfiles else "", " -sy" if args.symmetry else "",
+                                           " -ca \"%s\" -cs %d" % (args.cache, args.cachesize) if args.cache is not None else "",
+                                           " -mx" if args.metrics else "", " -pg" if args.progress else "", " -st %s" % args.stall if args.stall else "")
 
 buildings = []
+started = []
+deadline = time.time() + args.budget if args.budget else None
+
+def budgetOpts(until):
+    # time left until the deadline of the stage script and the next ones
+    return "" if until is None else " -bg %d" % max(1, until - time.time())
+
+def runChain(building, threads, workers):
+    # with a budget, the chain gets its share of the time left among the chains not started yet
+    until = None
+    if deadline is not None:
+        started.append(building)
+        until = time.time() + max(0.0, deadline - time.time()) * min(1.0, workers / float(len(buildings) - len(started) + 1))
+    if args.lexico:
+        os.system("%s -u \"%s/mip3.py\" -rd \"%s\" -wd \"%s\" -b %d -mt %d %s -lx -gp %s%s%s" % (vpy, spath, wdata, wpath, building, threads, sopts, args.gaps, " -fx" if args.fixed else "", budgetOpts(until)))
+        return
+    for step in [3, 4, 5]:
+        os.system("%s -u \"%s/mip%d.py\" -rd \"%s\" -wd \"%s\" -b %d -mt %d %s%s%s%s" % (vpy, spath, step, wdata, wpath, building, threads, sopts, " -gp %s" % args.gaps if step >= 4 else "", " -fx" if args.fixed else "", budgetOpts(until)))
 
 def getResult(step):
-    out = []
-    for root, dirs, files in os.walk(wpath):
-        for file in files:
-            if re.match(r'^mip_%d_' % step, file):
-                out.append(file)
-    return out
+    out = {}
+    for entry in sorted(os.listdir(wpath)):
+        match = re.match(r'^mip_%d_(\d+)(\.json)?$' % step, entry)
+        if match and (match.group(1) not in out or os.path.isdir(os.path.join(wpath, entry))):
+            out[match.group(1)] = entry
+    return list(out.values())
+
+if __name__ == '__main__':
 
-for root, dirs, files in os.walk(wpath):
-    for file in files:
-        if file in [".gitignore"]:
+    cached = None if args.cache is None else os.path.abspath(args.cache)
+    for root, dirs, files in os.walk(wpath, topdown=False):
+        # the stage result cache may live in the working directory: it is kept between runs
+        if cached is not None and (os.path.abspath(root) + os.sep).startswith(cached + os.sep):
             continue
-        os.remove(os.path.join(root, file))
+        for file in files:
+            if file in [".gitignore"]:
+                continue
+            os.remove(os.path.join(root, file))
+        if root != wpath and os.path.abspath(root) != cached and len(os.listdir(root)) == 0:
+            os.rmdir(root)
 
-if __name__ == '__main__':
+    if args.inprocess:
+        import instance, metrics, pipeline, visualizer
 
-    ##################
-    # process step 1 #
-    ##################
-    os.system("%s -u \"%s/mip1.py\" -rd \"%s\" -wd \"%s\" -mt %d" % (vpy, spath, wdata, wpath, maxThread))
-    for result in getResult(1):
-        building = int(result.split("_")[2].split(".")[0])
-        os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
-    
-    ##################
-    # process step 2 #
-    ##################
-    os.system("%s -u \"%s/mip2.py\" -rd \"%s\" -wd \"%s\" -mt %d" % (vpy, spath, wdata, wpath, maxThread))
-    for result in getResult(2):
-        building = int(result.split("_")[2].split(".")[0])
-        buildings.append(building)
-        os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
+        start = time.perf_counter()
+        data = instance.load(wdata)
+        metrics.loaded(time.perf_counter() - start)
+
+        pipeline.runPipeline(data, wpath, maxThread, checkpoint=args.checkpoint, visualize=visualizer.show, workers=args.workers,
+                             settings={"solver": args.solver, "keepfiles": args.keepfiles, "format": args.format, "formulation": args.formulation, "symmetry": args.symmetry, "aggregate": args.aggregate, "gaps": args.gaps, "heuristic": args.heuristic, "localsearch": args.localsearch, "cache": args.cache, "cachesize": args.cachesize, "metrics": args.metrics, "progress": args.progress, "stall": args.stall, "budget": args.budget, "lexico": args.lexico, "fixed": args.fixed})
+
+    else:
+        ##################
+        # process step 1 #
+        ##################
+        os.system("%s -u \"%s/mip1.py\" -rd \"%s\" -wd \"%s\" -mt %d %s%s%s" % (vpy, spath, wdata, wpath, maxThread, sopts, "%s%s -ls %d" % (" -ag" if args.aggregate else "", " -hs" if args.heuristic else "", args.localsearch), budgetOpts(deadline)))
+        for result in getResult(1):
+            building = int(result.split("_")[2].split(".")[0])
+            os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
     
-    ##################
-    # process step 3 #
-    ##################
-    for building in buildings:
-        os.system("%s -u \"%s/mip3.py\" -rd \"%s\" -wd \"%s\" -b %d -mt %d" % (vpy, spath, wdata, wpath, building, maxThread))
-    for result in getResult(3):
-        building = int(result.split("_")[2].split(".")[0])
-        os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
+        ##################
+        # process step 2 #
+        ##################
+        os.system("%s -u \"%s/mip2.py\" -rd \"%s\" -wd \"%s\" -mt %d %s%s%s" % (vpy, spath, wdata, wpath, maxThread, sopts, " -ag" if args.aggregate else "", budgetOpts(deadline)))
+        for result in getResult(2):
+            building = int(result.split("_")[2].split(".")[0])
+            buildings.append(building)
+            os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
     
-    ##################
-    # process step 4 #
-    ##################
-    for building in buildings:
-        os.system("%s -u \"%s/mip4.py\" -rd \"%s\" -wd \"%s\" -b %d -mt %d" % (vpy, spath, wdata, wpath, building, maxThread))
-    for result in getResult(4):
-        building = int(result.split("_")[2].split(".")[0])
-        os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
-
-    ##################
-    # process step 5 #
-    ##################
-    for building in buildings:
-        os.system("%s -u \"%s/mip5.py\" -rd \"%s\" -wd \"%s\" -b %d -mt %d" % (vpy, spath, wdata, wpath, building, maxThread))
-    for result in getResult(5):
-        building = int(result.split("_")[2].split(".")[0])
-        os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
\ No newline at end of file
+        ##########################
+        # process steps 3, 4 & 5 #
+        ##########################
+        workers = max(1, min(args.workers, len(buildings), maxThread))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda building: runChain(building, maxThread // workers, workers), buildings))
+        for result in getResult(3):
+            building = int(result.split("_")[2].split(".")[0])
+            os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
+        for result in getResult(4):
+            building = int(result.split("_")[2].split(".")[0])
+            os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
+        for result in getResult(5):
+            building = int(result.split("_")[2].split(".")[0])
+            os.system("%s -u \"%s/visualizer.py\" -rd \"%s\" -d \"%s/%s\"" % (vpy, spath, wdata, wpath, result))
+
+    if args.metrics:
+        import metrics
+
+        summary = metrics.summary(wpath)
+        if summary is not None:
+            metrics.printSummary(summary)
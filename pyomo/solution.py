@@ -0,0 +1,121 @@
+import os, json, numpy
+
+# Compact solution store. A result is a directory holding meta.json (building, objective, areas,
+# streams and the day/timeslot table) and one .npy array per variable:
+#   - binaries (X, Y, Q, U, V) keep only the index rows of the variables set to 1, sorted
+#     lexicographically; X stores the (day, timeslot) pair as its position in meta["dxt"],
+#   - integers (FIRST, LAST) keep every index row with the value in the last column.
+# Arrays are loaded memory-mapped so that only the rows actually read are paged in.
+
+binaries = ["X", "Y", "Q", "U", "V"]
+integers = ["FIRST", "LAST"]
+
+
+# =================================================
+#   Save
+# =================================================
+
+def encode(name, records, dxt):
+    rows = []
+    for i in records:
+        if name in binaries and round(i["state"]) == 0:
+            continue
+        key = list(i["tuple"])
+        if name == "X":
+            key = key[:4] + [dxt.setdefault((key[4], key[5]), len(dxt))]
+        if name in integers:
+            key = key + [round(i["state"])]
+        rows.append(key)
+    rows.sort()
+    width = {"X": 5, "Y": 3, "Q": 2, "U": 4, "V": 3, "FIRST": 3, "LAST": 3}[name]
+    return numpy.array(rows, dtype=numpy.int32).reshape(len(rows), width)
+
+
+def saveSolution(path, master):
+    os.makedirs(path, exist_ok=True)
+    if "variables" in master:
+        return copySolution(path, master)
+
+    dxt = {}
+    names = [name for name in binaries + integers if name in master]
+    for name in names:
+        numpy.save(os.path.join(path, "%s.npy" % name), encode(name, master[name], dxt))
+
+    meta = {key: master[key] for key in master if key not in names}
+    meta["variables"] = names
+    meta["dxt"] = [list(k) for k in sorted(dxt, key=dxt.get)]
+
+    with open(os.path.join(path, "meta.json"), "w") as outfile:
+        json.dump(meta, outfile)
+
+
+def copySolution(path, sol):
+    # A loaded solution (cache hit) is written back as it is
+    for name in sol["variables"]:
+        numpy.save(os.path.join(path, "%s.npy" % name), numpy.asarray(sol[name]))
+
+    with open(os.path.join(path, "meta.json"), "w") as outfile:
+        json.dump({key: sol[key] for key in sol if key not in sol["variables"]}, outfile)
+
+
+# =================================================
+#   Load
+# =================================================
+
+def loadSolution(path, mmap=True):
+    f = open(os.path.join(path, "meta.json"), "r")
+    sol = json.loads(f.read())
+    f.close()
+
+    for name in sol["variables"]:
+        sol[name] = numpy.load(os.path.join(path, "%s.npy" % name), mmap_mode="r" if mmap else None)
+
+    return sol
+
+
+def nonzero(sol, name):
+    # Index tuples of the binaries set to 1, or (tuple, value) pairs for FIRST/LAST
+    if name == "X":
+        dxt = sol["dxt"]
+        return [(int(a), int(s), int(b), int(r), dxt[k][0], dxt[k][1]) for a, s, b, r, k in sol[name].tolist()]
+    if name in integers:
+        return [(tuple(row[:-1]), row[-1]) for row in sol[name].tolist()]
+    return [tuple(row) for row in sol[name].tolist()]
+
+
+def toMaster(sol):
+    # Record form used by the JSON export ({"tuple", "state"}), restricted to the nonzero variables
+    master = {key: sol[key] for key in sol if key not in sol["variables"] and key not in ["variables", "dxt"]}
+    for name in sol["variables"]:
+        if name in integers:
+            master[name] = [{"tuple": i, "state": v} for i, v in nonzero(sol, name)]
+        else:
+            master[name] = [{"tuple": i, "state": 1} for i in nonzero(sol, name)]
+    return master
+
+
+# =================================================
+#   Results directory
+# =================================================
+
+def writeResult(wd, name, result, fmt="npy"):
+    if fmt in ["npy", "both"]:
+        saveSolution(os.path.join(wd, name), result)
+    if fmt in ["json", "both"]:
+        result = toMaster(result) if "variables" in result else result
+        with open(os.path.join(wd, "%s.json" % name), "w") as outfile:
+            for chunk in json.JSONEncoder().iterencode(result):
+                outfile.write(chunk)
+
+
+def readResult(path):
+    # path is either a solution directory (loaded memory-mapped, read through warmstart.nonzeros or
+    # nonzero) or a JSON export in record form (with or without the .json suffix)
+    if os.path.isdir(path):
+        return loadSolution(path)
+    if not path.endswith(".json") and not os.path.exists(path):
+        path = "%s.json" % path
+    f = open(path, "r")
+    result = json.loads(f.read())
+    f.close()
+    return result
@@ -0,0 +1,145 @@
+import math, time, progress
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+# Solver backends and the name each of them gives to the threads, time limit, relative MIP gap and
+# solution limit (stop after that many improving solutions) options. Shell interfaces exchange LP and solution files with the solver executable, direct and
+# persistent ones hand the model to the solver library in memory (persistent ones keep it loaded).
+backends = {
+    "cplex": {"factory": "cplex", "interface": "shell", "threads": "threads", "timelimit": "timelimit", "mipgap": "mip tolerances mipgap", "solutions": "mip limits solutions", "logfile": True},
+    "cplex_direct": {"factory": "cplex_direct", "interface": "direct", "threads": "threads", "timelimit": "timelimit", "mipgap": "mip_tolerances_mipgap", "solutions": "mip_limits_solutions", "logfile": True},
+    "cplex_persistent": {"factory": "cplex_persistent", "interface": "persistent", "threads": "threads", "timelimit": "timelimit", "mipgap": "mip_tolerances_mipgap", "solutions": "mip_limits_solutions", "logfile": True},
+    "highs": {"factory": "appsi_highs", "interface": "persistent", "threads": "threads", "timelimit": "time_limit", "mipgap": "mip_rel_gap", "solutions": "mip_max_improving_sols", "logfile": False},
+    "cbc": {"factory": "cbc", "interface": "shell", "threads": "threads", "timelimit": "seconds", "mipgap": "ratio", "solutions": "maxSolutions", "logfile": True},
+    "glpk": {"factory": "glpk", "interface": "shell", "threads": None, "timelimit": "tmlim", "mipgap": "mipgap", "solutions": None, "logfile": True},
+}
+
+# Time limit (s) and relative MIP gap of each stage
+limits = {
+    1: (None, None),
+    2: (None, 0.05),
+    3: (None, None),
+    4: (60*15, 0.05),
+    5: (60*15, 0.05),
+}
+
+
+def stageBackend(spec, stage):
+    # A single backend name for every stage, or one comma separated name per stage
+    names = spec.split(",")
+    if len(names) not in [1, len(limits)]:
+        raise ValueError("%d solver backends in '%s' (expected one, or one per stage: %d)" % (len(names), spec, len(limits)))
+    name = names[0] if len(names) == 1 else names[stage - 1]
+    if name not in backends:
+        raise ValueError("unknown solver backend '%s' (expected one of %s)" % (name, ", ".join(backends)))
+    return name
+
+
+def getSolver(name, threads, timelimit=None, mipgap=None, solutions=None):
+    backend = backends[name]
+
+    opt = pyo.SolverFactory(backend["factory"])
+    if backend["threads"] is not None:
+        opt.options[backend["threads"]] = threads
+    setLimits(name, opt, timelimit=timelimit, mipgap=mipgap)
+    if solutions is not None and backend["solutions"] is not None:
+        opt.options[backend["solutions"]] = solutions
+
+    return opt
+
+
+def setLimits(name, opt, timelimit=None, mipgap=None):
+    # Time limit and gap of the next solve (None: solver default), for a solver reused between solves
+    backend = backends[name]
+    for option, value in [("timelimit", timelimit), ("mipgap", mipgap)]:
+        if value is not None:
+            opt.options[backend[option]] = value
+        elif backend[option] in opt.options:
+            del opt.options[backend[option]]
+
+
+def update(name, opt, constraints=(), objective=None):
+    # Rows added to a model already loaded in a persistent solver, and its new objective: the appsi
+    # interfaces find them at the next solve, cplex_persistent is told
+    if opt is None or name != "cplex_persistent":
+        return
+    for constraint in constraints:
+        opt.add_constraint(constraint)
+    if objective is not None:
+        opt.set_objective(objective)
+
+
+def solverTime(results):
+    # Time reported by the solver itself: the external process for shell interfaces, the library
+    # call for the direct ones. None when the interface does not report it.
+    for name in ["wallclock_time", "time"]:
+        value = getattr(results.solver, name, None)
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+def hasSolution(results, sense):
+    # True when the solver came back with an incumbent, proven optimal or not (time limit)
+    condition = results.solver.termination_condition
+    if condition in [TerminationCondition.optimal, TerminationCondition.locallyOptimal, TerminationCondition.globallyOptimal, TerminationCondition.feasible]:
+        return True
+    if condition in [TerminationCondition.infeasible, TerminationCondition.infeasibleOrUnbounded, TerminationCondition.invalidProblem,
+                     TerminationCondition.solverFailure, TerminationCondition.internalSolverError, TerminationCondition.error]:
+        return False
+    bound = results.problem.upper_bound if sense == pyo.minimize else results.problem.lower_bound
+    return isinstance(bound, (int, float)) and math.isfinite(bound)
+
+
+def bestBound(results, sense):
+    bound = results.problem.lower_bound if sense == pyo.minimize else results.problem.upper_bound
+    return float(bound) if isinstance(bound, (int, float)) and math.isfinite(bound) else None
+
+
+def relativeGap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return abs(objective - bound) / max(abs(objective), 1e-10)
+
+
+def solve(name, opt, model, logfile, warmstart=False, keepfiles=False, track=None, loaded=False):
+    # track: progress tracker (progress.tracker) fed by the solver callbacks during the solve.
+    # loaded: the persistent solver already holds the model (re-solve after update())
+    backend = backends[name]
+    timing = {"write": 0.0, "solve": 0.0}
+
+    if backend["interface"] == "persistent" and not loaded:
+        start = time.perf_counter()
+        opt.set_instance(model)
+        timing["write"] = time.perf_counter() - start
+    progress.attach(name, opt, track)
+
+    kwargs = {"keepfiles": keepfiles}
+    if backend["logfile"]:
+        kwargs["logfile"] = logfile
+    if warmstart and opt.warm_start_capable():
+        kwargs["warmstart"] = True
+
+    # The appsi interfaces raise when asked to load a solution that does not exist (time limit
+    # without incumbent): the solution is loaded here only when there is one
+    loader = backend["factory"].startswith("appsi_")
+    if loader:
+        kwargs["load_solutions"] = False
+
+    start = time.perf_counter()
+    results = opt.solve(model, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    sense = next(model.component_data_objects(pyo.Objective, active=True)).sense
+    progress.stopped(track, results, sense)
+    if loader and hasSolution(results, sense):
+        opt.load_vars()
+
+    reported = solverTime(results)
+    if reported is None or reported > elapsed:
+        timing["solve"] = elapsed
+    else:
+        timing["solve"] = reported
+        timing["write"] += elapsed - reported
+
+    return results, timing
@@ -15,4 +15,4 @@ spath='/home/umons/math/arosati/mip-pyomo-glpk/pyomo'
 wpath='/home/umons/math/arosati/mip-pyomo-glpk/pyomo/output'
 wdata='/home/umons/math/arosati/mip-pyomo-glpk/data/data.json'
 
-srun python3 -u /home/umons/math/arosati/mip-pyomo-glpk/pyomo/runner.py ${cpu} ${spath} ${wpath} ${wdata} 2>&1 output.log
\ No newline at end of file
+srun python3 -u /home/umons/math/arosati/mip-pyomo-glpk/pyomo/runner.py ${cpu} ${spath} ${wpath} ${wdata} --inprocess --checkpoint --workers 6 2>&1 output.log
\ No newline at end of file
@@ -0,0 +1,114 @@
+import time, logging, solution
+import pyomo.environ as pyo
+from datetime import datetime
+
+# Warm start from the result of an upstream stage. Only the variables set to a nonzero value are
+# read, mapped onto the index of the new model in one pass and assigned. U, FIRST and LAST are
+# derived from X when the upstream stage did not have them, so the start stays consistent, and
+# START/END (time-indexed gaps) from FIRST/LAST. With the symmetry breaking of interchangeable rooms,
+# the upstream sessions are first moved between those rooms to satisfy the model ordering. Models
+# without X (aggregated stages 1 and 2) only get the variables they have.
+
+binaries = ["X", "Y", "Q", "U", "V"]
+spans = ["START", "END"]
+
+
+def nonzeros(warmup, name):
+    if "variables" in warmup:
+        if name not in warmup["variables"]:
+            return []
+        if name in solution.integers:
+            return solution.nonzero(warmup, name)
+        return [(i, 1) for i in solution.nonzero(warmup, name)]
+    return [(tuple(i["tuple"]), round(i["state"])) for i in warmup.get(name, []) if round(i["state"]) != 0]
+
+
+def derived(model, values):
+    if len(values["U"]) == 0:
+        values["U"] = list({(a, s, b, r): 1 for (a, s, b, r, d, t), _ in values["X"]}.items())
+
+    if len(values["FIRST"]) == 0 or len(values["LAST"]) == 0:
+        first = {}
+        last = {}
+        for (a, s, b, r, d, t), _ in values["X"]:
+            slot = model.VAL[(d, t)]
+            first[(a, s)] = min(first.get((a, s), slot), slot)
+            last[(a, s)] = max(last.get((a, s), slot), slot)
+        values["FIRST"] = list(first.items())
+        values["LAST"] = list(last.items())
+
+    return values
+
+
+def relabel(model, values):
+    following = {r: r_ for b, r, r_ in model.TWINS}
+    chains = []
+    for r in set(following) - set(following.values()):
+        chains.append([r])
+        while chains[-1][-1] in following:
+            chains[-1].append(following[chains[-1][-1]])
+    chainOf = {r: k for k, chain in enumerate(chains) for r in chain}
+
+    if hasattr(model, "const19"):
+        # every slot: the sessions of a class fill its first rooms
+        groups = {}
+        for (a, s, b, r, d, t), v in values["X"]:
+            if r in chainOf:
+                groups.setdefault((chainOf[r], d, t), []).append((a, s, b, r, d, t))
+        mapping = {}
+        for (k, d, t), keys in groups.items():
+            for n, i in enumerate(sorted(keys, key=lambda i: chains[k].index(i[3]))):
+                mapping[i] = i[:3] + (chains[k][n], d, t)
+    else:
+        # whole conference: the rooms of a class in decreasing occupancy
+        usage = {}
+        for (a, s, b, r, d, t), v in values["X"]:
+            usage[r] = usage.get(r, 0) + 1
+        rank = {}
+        for chain in chains:
+            for n, r in enumerate(sorted(chain, key=lambda r: (-usage.get(r, 0), chain.index(r)))):
+                rank[r] = chain[n]
+        mapping = {i: i[:3] + (rank[i[3]],) + i[4:] for i, v in values["X"] if i[3] in rank}
+
+    values["X"] = [(mapping.get(i, i), v) for i, v in values["X"]]
+    values["U"] = []
+    return values
+
+
+def timeIndexed(model, values):
+    slots = {model.VAL[i]: i for i in model.DxT}
+    values["START"] = [((a, s) + slots[v], 1) for (a, s), v in values["FIRST"] if v in slots]
+    values["END"] = [((a, s) + slots[v], 1) for (a, s), v in values["LAST"] if v in slots]
+    return values
+
+
+def apply(model, warmup, complete=True):
+    # complete=False leaves the variables that are not set upstream without a value, which the
+    # CPLEX interfaces send as a partial MIP start instead of a full value vector.
+    start = time.perf_counter()
+
+    # Y and Q are parameters in the models that take the building assignment as data (fixed)
+    values = {name: [] for name in binaries + solution.integers if isinstance(getattr(model, name, None), pyo.Var)}
+    for name in values:
+        var = getattr(model, name)
+        values[name] = [(i, v) for i, v in nonzeros(warmup, name) if i in var]
+    if hasattr(model, "TWINS"):
+        values = relabel(model, values)
+    if hasattr(model, "X"):
+        values = derived(model, values)
+    if hasattr(model, "START"):
+        values = timeIndexed(model, values)
+
+    if complete:
+        for name in [name for name in binaries + spans if isinstance(getattr(model, name, None), pyo.Var)]:
+            for v in getattr(model, name).values():
+                v.set_value(0, skip_validation=True)
+
+    count = 0
+    for name in values:
+        var = getattr(model, name)
+        for i, v in values[name]:
+            var[i].set_value(v, skip_validation=True)
+        count += len(values[name])
+
+    logging.info("[%s] warm start: %d nonzero values set in %.3fs" % (datetime.now(), count, time.perf_counter() - start))
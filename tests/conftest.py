@@ -0,0 +1,13 @@
+import os, sys, json, copy, pytest
+
+# The pipeline modules import each other as top-level modules from pyomo/
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "pyomo"))
+
+with open(os.path.join(root, "data", "light.json"), "r") as f:
+    light = json.load(f)
+
+
+@pytest.fixture
+def data():
+    return copy.deepcopy(light)
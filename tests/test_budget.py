@@ -0,0 +1,34 @@
+import time, budget, solver
+
+
+def test_unbudgeted():
+    assert budget.start({}) == {}
+    assert budget.limits({}, 4) == solver.limits[4]
+
+
+def test_on_plan():
+    settings = budget.start({"budget": 1000})
+    timelimit, mipgap = budget.limits(settings, 1)
+
+    assert 280 < timelimit <= 285 and mipgap is None
+    assert budget.limits(settings, 2)[1] == solver.limits[2][1]
+
+
+def test_unused_time():
+    # mip1 done in no time: the 1000s left are shared by stages 2 to 5, the plan kept 700s for them
+    settings = budget.start({"budget": 1000})
+    timelimit, mipgap = budget.limits(settings, 2)
+
+    assert 265 < timelimit <= 272 and mipgap == solver.limits[2][1]
+
+
+def test_overrun():
+    # mip1 took 900s of 1000s: 100s left where the plan kept 700s
+    settings = dict(budget.start({"budget": 1000}), planned=(time.time() - 900, 1))
+    settings["deadline"] -= 900
+    timelimit, mipgap = budget.limits(settings, 2)
+
+    assert 25 < timelimit <= 28
+    # 1/7 of the planned time: 0.05 relaxed to 0.35, capped, and the exact mip3 at 1/5 to 5e-4
+    assert mipgap == budget.loose
+    assert abs(budget.limits(settings, 3)[1] - 5e-4) < 1e-6
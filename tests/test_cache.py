@@ -0,0 +1,83 @@
+import os, cache
+import pyomo.environ as pyo
+from pyomo.opt import SolverResults
+
+
+def building(data, b):
+    streams = [s for s in data["streams"] if s["id"] % 2 == b % 2]
+    return {"buildingId": b, "objective": {"value": 3}, "areas": sorted(set(s["areaId"] for s in streams)),
+            "streams": [s["id"] for s in streams], "X": [], "Y": [{"tuple": (s["areaId"], s["id"], b), "state": 1} for s in streams]}
+
+
+def test_miss_then_hit(data, tmp_path):
+    settings = {"solver": "highs", "cache": str(tmp_path)}
+    warmup = building(data, 1)
+    key = cache.stageKey(data, 3, settings, warmup=warmup)
+
+    assert cache.load(settings, key) is None
+    cache.store(settings, key, 3, {"mip_3_1": warmup})
+    hit = cache.load(settings, key)
+
+    assert list(hit) == ["mip_3_1"]
+    assert hit["mip_3_1"]["streams"] == warmup["streams"]
+    assert cache.stageKey(data, 3, settings, warmup=hit["mip_3_1"]) == cache.stageKey(data, 3, settings, warmup=warmup)
+
+
+def test_disabled(data):
+    settings = {"solver": "highs", "cache": None}
+    key = cache.stageKey(data, 1, settings)
+    cache.store(settings, key, 1, {"mip_1": building(data, 1)})
+    assert cache.load(settings, key) is None
+
+
+def test_key_inputs(data):
+    settings = {"solver": "highs"}
+    warmup = building(data, 1)
+    key = lambda stage, **changes: cache.stageKey(data, stage, dict(settings, **changes), warmup=warmup, mip3=warmup if stage == 5 else None)
+
+    # options read by the stage
+    assert key(1, heuristic=True) != key(1)
+    assert key(4, gaps="time") != key(4)
+    assert key(3, symmetry=True) != key(3)
+    assert key(3, solver="cplex") != key(3)
+    # options of the upstream stages
+    assert key(3, heuristic=True) == key(3)
+    assert key(3, gaps="time") == key(3)
+    # upstream result
+    assert cache.stageKey(data, 3, settings, warmup=dict(warmup, objective={"value": 4})) != key(3)
+    assert cache.stageKey(data, 3, settings, warmup=building(data, 2)) != key(3)
+
+
+def test_evict(data, tmp_path):
+    settings = {"solver": "highs", "cache": str(tmp_path)}
+    keys = [cache.stageKey(data, 3, settings, warmup=building(data, b)) for b in [1, 2]]
+    cache.store(settings, keys[0], 3, {"mip_3_1": building(data, 1)})
+    os.utime(os.path.join(str(tmp_path), keys[0], "entry.json"), (1, 1))
+    cache.store(settings, keys[1], 3, {"mip_3_2": building(data, 2)})
+
+    cache.evict(str(tmp_path), cache.entrySize(os.path.join(str(tmp_path), keys[1])))
+
+    assert cache.load(settings, keys[0]) is None
+    assert cache.load(settings, keys[1]) is not None
+
+
+def outcome(objective, bound, sense=pyo.minimize):
+    model = pyo.ConcreteModel()
+    model.x = pyo.Var(initialize=objective)
+    model.objective = pyo.Objective(expr=model.x, sense=sense)
+    results = SolverResults()
+    results.problem.lower_bound, results.problem.upper_bound = (bound, objective) if sense == pyo.minimize else (objective, bound)
+    return model, results
+
+
+def test_truncated():
+    # the key has no stall or budget: a run they cut short is not stored
+    assert not cache.complete(4, *outcome(2, 0.6426))
+    assert not cache.complete(3, *outcome(4, 3))
+    assert not cache.complete(2, *outcome(10, 12, sense=pyo.maximize))
+    assert not cache.complete(1, *outcome(2, float("-inf")))
+    # proven optimal, or within the target gap of the stage
+    assert cache.complete(3, *outcome(4, 4))
+    assert cache.complete(4, *outcome(0, -1e-9))
+    assert cache.complete(4, *outcome(40, 39))
+    assert cache.complete(2, *outcome(10, 10.2, sense=pyo.maximize))
@@ -0,0 +1,30 @@
+import pytest, instance
+
+
+def test_valid(data):
+    data["streams"][0]["sessions"] = "2"
+    out = instance.validate(data)
+
+    assert out["streams"][0]["sessions"] == 2
+    index = instance.indexes(out)
+    assert sum(len(rooms) for rooms in index["roomsByBuilding"].values()) == len(data["rooms"])
+    assert index["dxt"][0] == ("M", "A") and index["slots"][("M", "A")] == 1
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda d: d.pop("rooms"), "rooms is missing"),
+    (lambda d: d["streams"][0].pop("att"), "has no att"),
+    (lambda d: d["streams"][0].update(sessions="two"), "is not an integer"),
+    (lambda d: d["streams"][0].update(sessions=True), "is not an integer"),
+    (lambda d: d["rooms"][1].update(id=d["rooms"][0]["id"]), "duplicate rooms id"),
+    (lambda d: d["streams"][0].update(areaId=99), "unknown area 99"),
+    (lambda d: d["rooms"][0].update(buildingId=99), "unknown building 99"),
+    (lambda d: d["streams"][0].update(sessions=0), "at least one session"),
+    (lambda d: d["daysXtimeslots"][1].update(timeslot="A"), "duplicate (day, timeslot)"),
+    (lambda d: d["daysXtimeslots"][0].update(day="X"), "unknown day or timeslot"),
+    (lambda d: d["areasMatrix"].append([1, 99]), "is not a pair of areas"),
+])
+def test_invalid(data, change, message):
+    change(data)
+    with pytest.raises(Exception, match="Invalid instance: .*%s" % message.replace("(", r"\(").replace(")", r"\)")):
+        instance.validate(data)
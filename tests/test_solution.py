@@ -0,0 +1,61 @@
+import solution, warmstart
+
+
+def master():
+    return {"buildingId": 1, "objective": {"value": 5.29}, "areas": [1, 3], "streams": [2, 1],
+            "X": [{"tuple": (1, 2, 1, 4, "T", "B"), "state": 1}, {"tuple": (1, 1, 1, 2, "M", "A"), "state": 1},
+                  {"tuple": (1, 1, 1, 3, "M", "B"), "state": 0}],
+            "Y": [{"tuple": (1, 1, 1), "state": 1}, {"tuple": (1, 2, 1), "state": 0.9999}],
+            "Q": [{"tuple": (1, 1), "state": 1}, {"tuple": (3, 1), "state": 0}],
+            "FIRST": [{"tuple": (1, 1), "state": 1}, {"tuple": (1, 2), "state": 5}],
+            "LAST": [{"tuple": (1, 1), "state": 2.0000001}, {"tuple": (1, 2), "state": 5}]}
+
+
+def test_roundtrip(tmp_path):
+    solution.saveSolution(str(tmp_path / "mip_5_1"), master())
+    sol = solution.loadSolution(str(tmp_path / "mip_5_1"))
+
+    assert sol["buildingId"] == 1 and sol["objective"] == {"value": 5.29}
+    assert sol["variables"] == ["X", "Y", "Q", "FIRST", "LAST"]
+    assert solution.nonzero(sol, "X") == [(1, 1, 1, 2, "M", "A"), (1, 2, 1, 4, "T", "B")]
+    assert solution.nonzero(sol, "Y") == [(1, 1, 1), (1, 2, 1)]
+    assert solution.nonzero(sol, "Q") == [(1, 1)]
+    assert solution.nonzero(sol, "LAST") == [((1, 1), 2), ((1, 2), 5)]
+
+
+def test_master(tmp_path):
+    solution.saveSolution(str(tmp_path / "mip_5_1"), master())
+    out = solution.toMaster(solution.loadSolution(str(tmp_path / "mip_5_1"), mmap=False))
+
+    assert out["streams"] == [2, 1]
+    assert out["X"] == [{"tuple": (1, 1, 1, 2, "M", "A"), "state": 1}, {"tuple": (1, 2, 1, 4, "T", "B"), "state": 1}]
+    assert out["FIRST"] == [{"tuple": (1, 1), "state": 1}, {"tuple": (1, 2), "state": 5}]
+    assert "dxt" not in out and "variables" not in out
+
+
+def test_empty(tmp_path):
+    solution.saveSolution(str(tmp_path / "mip_3_2"), {"buildingId": 2, "objective": {"value": 0}, "X": [], "U": []})
+    sol = solution.loadSolution(str(tmp_path / "mip_3_2"))
+
+    assert solution.nonzero(sol, "X") == [] and solution.nonzero(sol, "U") == []
+
+
+def test_results(tmp_path):
+    for fmt in ["npy", "json"]:
+        (tmp_path / fmt).mkdir()
+        solution.writeResult(str(tmp_path / fmt), "mip_4_1", master(), fmt=fmt)
+        out = solution.readResult(str(tmp_path / fmt / "mip_4_1"))
+        assert ("variables" in out) == (fmt == "npy")
+        assert out["objective"] == {"value": 5.29}
+        assert sorted(i for i, v in warmstart.nonzeros(out, "X")) == [(1, 1, 1, 2, "M", "A"), (1, 2, 1, 4, "T", "B")]
+        assert warmstart.nonzeros(out, "LAST") == [((1, 1), 2), ((1, 2), 5)]
+
+
+def test_rewrite(tmp_path):
+    # a loaded solution (cache hit) written to the results directory in both formats
+    solution.saveSolution(str(tmp_path / "cache"), master())
+    sol = solution.loadSolution(str(tmp_path / "cache"))
+    solution.writeResult(str(tmp_path), "mip_4_1", sol, fmt="both")
+
+    assert solution.nonzero(solution.loadSolution(str(tmp_path / "mip_4_1")), "X") == solution.nonzero(sol, "X")
+    assert solution.readResult(str(tmp_path / "mip_4_1.json"))["FIRST"] == [{"tuple": [1, 1], "state": 1}, {"tuple": [1, 2], "state": 5}]